@@ -0,0 +1,297 @@
+"""
+Inference backends for the embedding server.
+
+Every backend maps padded tokenizer features (torch tensors) to the model's
+last hidden state, so tokenization, bucketing and pooling (embed_texts) are the
+same whatever runs the forward pass, in the server process or a worker.
+
+    torch      PyTorch AutoModel, fp32 eager mode (optionally on shared mmap weights)
+    onnx       ONNX Runtime on an fp32 export of the model
+    onnx-int8  ONNX Runtime on the export with dynamic int8 weight quantization
+
+ONNX exports are cached under ONNX_CACHE_DIR/<model>/ and reused across restarts.
+Run `python backends.py` to export and print the drift report for EMBED_MODEL.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+import torch
+from huggingface_hub import try_to_load_from_cache
+from transformers import AutoConfig, AutoModel
+
+from config import (
+    EMBED_MODEL, ONNX_CACHE_DIR, ONNX_THREADS, MAX_TOKEN, BUCKET_SIZE,
+    INFERENCE_BACKEND, DRIFT_CHECK, DRIFT_MIN_COSINE,
+)
+
+ONNX_OPSET = 14
+
+DRIFT_TEXTS = [
+    "What is the excess for a windscreen claim?",
+    "Policy Number: HX-2231-77\tStart Date: 01/03/2024\tEnd Date: 28/02/2025",
+    "We will not pay for loss or damage caused by wear and tear, corrosion or gradual deterioration.",
+    "Claims must be reported within 30 days of the incident by calling the claims line.",
+    "Accidental damage cover",
+]
+
+
+def mean_pool(hidden, attention_mask):
+    """Mean over real tokens only, so padding never leaks into a vector."""
+    mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+    return (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+
+
+# --- Shared weights ---
+_SAFETENSORS_DTYPES = {
+    "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "U8": torch.uint8, "BOOL": torch.bool,
+}
+
+
+def safetensors_path(model_name: str):
+    if os.path.isdir(model_name):
+        path = os.path.join(model_name, "model.safetensors")
+        return path if os.path.exists(path) else None
+    path = try_to_load_from_cache(model_name, "model.safetensors")
+    return path if isinstance(path, str) else None
+
+
+def mmap_state_dict(path: str) -> dict:
+    """
+    Tensors backed by a private (copy-on-write) mmap of a safetensors file.
+    Every process that maps the same file shares its page-cache pages, so N
+    workers hold one copy of the weights between them.
+    """
+    with open(path, "rb") as f:
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+    header.pop("__metadata__", None)
+
+    storage = torch.UntypedStorage.from_file(path, False, os.path.getsize(path))
+    base = 8 + header_len
+    state = {}
+    for name, info in header.items():
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        start, _ = info["data_offsets"]
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        offset, rem = divmod(base + start, itemsize)
+        if rem:
+            raise ValueError(f"{name} is not aligned in {path}")
+        state[name] = torch.empty(0, dtype=dtype).set_(storage, offset, info["shape"])
+    return state
+
+
+def load_shared_model(model_name: str):
+    """
+    Build the model skeleton without allocating weights, then assign mmap-backed
+    tensors in place. Returns None if the checkpoint has no safetensors file or
+    does not cover every parameter, so callers can fall back to from_pretrained.
+    """
+    from accelerate import init_empty_weights
+
+    path = safetensors_path(model_name)
+    if not path:
+        return None
+
+    config = AutoConfig.from_pretrained(model_name, local_files_only=True)
+    with init_empty_weights():  # parameters on "meta"; buffers are still real
+        model = AutoModel.from_config(config)
+
+    state = mmap_state_dict(path)
+    prefix = f"{model.base_model_prefix}."
+    if not any(k in model.state_dict() for k in state) and any(k.startswith(prefix) for k in state):
+        state = {k[len(prefix):]: v for k, v in state.items() if k.startswith(prefix)}
+    model.load_state_dict(state, strict=False, assign=True)
+
+    if any(p.is_meta for p in model.parameters()):
+        return None
+    print(f"🧠 Mapped {model_name} weights from {path}")
+    return model
+
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, model_name: str, model=None, shared: bool = False):
+        if model is None and shared:
+            model = load_shared_model(model_name)
+            if model is None:
+                print(f"⚠️ No usable safetensors checkpoint for {model_name}, loading a private copy")
+        self.model = model or AutoModel.from_pretrained(model_name, local_files_only=True)
+        self.model.eval()
+
+    def hidden_states(self, features):
+        with torch.no_grad():
+            return self.model(**features).last_hidden_state
+
+
+class _LastHiddenState(torch.nn.Module):
+    """Export wrapper: positional inputs in tokenizer order -> last_hidden_state."""
+
+    def __init__(self, model, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model(**dict(zip(self.input_names, inputs))).last_hidden_state
+
+
+def onnx_path(model_name: str, quantize: bool = False) -> str:
+    cache = os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "__"))
+    return os.path.join(cache, "model.int8.onnx" if quantize else "model.onnx")
+
+
+def prepare_onnx(model_name: str, tokenizer, quantize: bool = False, torch_model=None) -> str:
+    """
+    Export (and quantize) the model into the ONNX cache if it is not there yet.
+    Call this once in the parent before starting inference workers, so they only
+    ever open finished files. Temp files are per-process, so concurrent callers
+    never write the same path.
+    """
+    fp32_path = onnx_path(model_name)
+    path = onnx_path(model_name, quantize)
+
+    if not os.path.exists(fp32_path):
+        OnnxBackend.export(model_name, tokenizer, fp32_path, torch_model)
+    if quantize and not os.path.exists(path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"🗜️ Quantizing {fp32_path} to int8")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        quantize_dynamic(fp32_path, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, path)
+    return path
+
+
+class OnnxBackend:
+    def __init__(self, model_name: str, tokenizer, quantize: bool = False, torch_model=None, threads: int = 0):
+        import onnxruntime as ort
+
+        self.name = "onnx-int8" if quantize else "onnx"
+        path = prepare_onnx(model_name, tokenizer, quantize, torch_model)
+
+        options = ort.SessionOptions()
+        threads = threads or ONNX_THREADS
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.path = path
+        print(f"✅ ONNX Runtime session ready: {path}")
+
+    @staticmethod
+    def export(model_name: str, tokenizer, path: str, torch_model=None):
+        model = torch_model or AutoModel.from_pretrained(model_name, local_files_only=True)
+        model.eval()
+
+        dummy = tokenizer(["export warmup", "a somewhat longer export warmup text"],
+                          padding=True, return_tensors="pt")
+        names = [n for n in tokenizer.model_input_names if n in dummy]
+        axes = {n: {0: "batch", 1: "sequence"} for n in names}
+        axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        print(f"📦 Exporting {model_name} to ONNX ({', '.join(names)})")
+        with torch.no_grad():
+            torch.onnx.export(
+                _LastHiddenState(model, names),
+                tuple(dummy[n] for n in names),
+                tmp,
+                input_names=names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=axes,
+                opset_version=ONNX_OPSET,
+            )
+        os.replace(tmp, path)
+
+    def hidden_states(self, features):
+        feeds = {n: features[n].numpy() for n in self.input_names}
+        return torch.from_numpy(self.session.run(["last_hidden_state"], feeds)[0])
+
+
+def load_backend(kind: str, model_name: str, tokenizer, torch_model=None, threads: int = 0):
+    if kind == "torch":
+        return TorchBackend(model_name, torch_model)
+    if kind in ("onnx", "onnx-int8"):
+        return OnnxBackend(model_name, tokenizer, quantize=kind == "onnx-int8",
+                           torch_model=torch_model, threads=threads)
+    raise ValueError(f"Unknown INFERENCE_BACKEND: {kind}")
+
+
+def prepare_backend(name: str, tokenizer):
+    """Build any on-disk artifacts the configured backend needs (ONNX export, int8 model)."""
+    if INFERENCE_BACKEND in ("onnx", "onnx-int8"):
+        prepare_onnx(name, tokenizer, quantize=INFERENCE_BACKEND == "onnx-int8")
+
+
+def load_model_backend(name: str, tokenizer, shared: bool = False, threads: int = 0):
+    """
+    Build the configured backend for a model. Returns (backend, drift report or None).
+    threads caps ONNX Runtime intra-op threads (0 uses ONNX_THREADS).
+    """
+    backend, drift = TorchBackend(name, shared=shared), None
+    if INFERENCE_BACKEND != "torch":
+        reference = backend
+        backend = load_backend(INFERENCE_BACKEND, name, tokenizer, reference.model, threads)
+        if DRIFT_CHECK:
+            drift = drift_check(tokenizer, reference, backend, max_length=MAX_TOKEN)
+            print(f"📏 Drift vs torch for {name}: {drift}")
+            if drift["min_cosine"] < DRIFT_MIN_COSINE:
+                print(f"⚠️ {backend.name} drifted below {DRIFT_MIN_COSINE} cosine, falling back to torch")
+                backend = reference
+    return backend, drift
+
+
+def embed_texts(tokenizer, backend, texts):
+    """
+    Embed texts in length-sorted sub-batches. Returns (float32 vector, token_count)
+    per text, in the original order.
+    """
+    encoded = tokenizer(texts, truncation=True, max_length=MAX_TOKEN)
+    lengths = [len(ids) for ids in encoded["input_ids"]]
+    order = sorted(range(len(texts)), key=lengths.__getitem__)
+
+    results = [None] * len(texts)
+    for start in range(0, len(order), BUCKET_SIZE):
+        bucket = order[start:start + BUCKET_SIZE]
+        features = tokenizer.pad(
+            {k: [encoded[k][i] for i in bucket] for k in encoded.keys()},
+            return_tensors="pt",
+        )
+        hidden = backend.hidden_states(features)
+        pooled = mean_pool(hidden, features["attention_mask"]).numpy().astype(np.float32, copy=False)
+        for i, emb in zip(bucket, pooled):
+            results[i] = (emb, lengths[i])
+    return results
+
+
+def drift_check(tokenizer, reference, candidate, texts=DRIFT_TEXTS, max_length: int = 384) -> dict:
+    """Compare pooled embeddings of candidate against reference (normally torch)."""
+    features = tokenizer(texts, padding=True, truncation=True, max_length=max_length, return_tensors="pt")
+    mask = features["attention_mask"]
+    ref = mean_pool(reference.hidden_states(features), mask)
+    cand = mean_pool(candidate.hidden_states(features), mask)
+
+    cosine = torch.nn.functional.cosine_similarity(ref, cand, dim=1)
+    return {
+        "backend": candidate.name,
+        "texts": len(texts),
+        "min_cosine": round(cosine.min().item(), 6),
+        "mean_cosine": round(cosine.mean().item(), 6),
+        "max_abs_diff": round((ref - cand).abs().max().item(), 6),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    from transformers import AutoTokenizer
+
+    model_name = EMBED_MODEL
+    kind = sys.argv[1] if len(sys.argv) > 1 else "onnx-int8"
+    tok = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
+    reference = TorchBackend(model_name)
+    print(json.dumps(drift_check(tok, reference, load_backend(kind, model_name, tok, reference.model)), indent=2))
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DynamicBatcher:
+    """
+    Coalesce concurrent embedding requests into shared forward passes.
+
+    Requests are queued with their texts. A single scheduler task takes the
+    oldest request and keeps adding queued ones until max_batch texts are
+    collected (requests are never split) or max_wait_ms has passed since it
+    arrived. It then runs infer(texts) once on a dedicated inference thread so
+    the event loop stays free, and hands each caller the slice of results for
+    its own texts.
+
+    With concurrency > 1 that many batches run at once (for infer functions
+    backed by several worker processes); while all slots are busy, requests
+    keep queueing and the next batch grows.
+
+    infer(texts) must return one result per text, in order.
+    """
+
+    def __init__(self, infer, max_batch: int = 64, max_wait_ms: float = 5.0, concurrency: int = 1):
+        self.infer = infer
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.task = None
+        self._carry = None  # request that did not fit the previous batch
+        self.concurrency = max(1, concurrency)
+        self.slots = None
+        self.running = set()
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="inference")
+        self.stats = {
+            "requests": 0, "batches": 0, "texts": 0,
+            "queue_ms_total": 0.0, "queue_ms_max": 0.0,
+            "infer_ms_total": 0.0, "batch_size_max": 0,
+        }
+
+    # --- Lifecycle ---
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        self.executor.shutdown(wait=False)
+
+    # --- Public API ---
+    async def submit(self, texts: list) -> list:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future, time.perf_counter()))
+        return await future
+
+    def metrics(self) -> dict:
+        s = self.stats
+        batches, requests = s["batches"] or 1, s["requests"] or 1
+        return {
+            "requests": s["requests"],
+            "batches": s["batches"],
+            "texts": s["texts"],
+            "avg_batch_size": round(s["texts"] / batches, 2),
+            "max_batch_size": s["batch_size_max"],
+            "avg_requests_per_batch": round(s["requests"] / batches, 2),
+            "avg_queue_ms": round(s["queue_ms_total"] / requests, 2),
+            "max_queue_ms": round(s["queue_ms_max"], 2),
+            "avg_infer_ms": round(s["infer_ms_total"] / batches, 2),
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "concurrency": self.concurrency,
+            "batches_running": len(self.running),
+        }
+
+    # --- Scheduler ---
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [self._carry or await self.queue.get()]
+        self._carry = None
+        size = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+
+        while size < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if size + len(item[0]) > self.max_batch:
+                self._carry = item  # opens the next batch instead
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run(self):
+        while True:
+            await self.slots.acquire()
+            batch = await self._collect()
+            task = asyncio.create_task(self._execute(batch))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def _execute(self, batch):
+        loop = asyncio.get_running_loop()
+        texts = [t for item in batch for t in item[0]]
+        started = time.perf_counter()
+
+        try:
+            results = await loop.run_in_executor(self.executor, self.infer, texts)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.slots.release()
+
+        infer_ms = 1000 * (time.perf_counter() - started)
+        pos = 0
+        for item_texts, future, enqueued in batch:
+            queue_ms = 1000 * (started - enqueued)
+            self.stats["queue_ms_total"] += queue_ms
+            self.stats["queue_ms_max"] = max(self.stats["queue_ms_max"], queue_ms)
+            if not future.done():  # caller may have gone away
+                future.set_result(results[pos:pos + len(item_texts)])
+            pos += len(item_texts)
+
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["texts"] += len(texts)
+        self.stats["infer_ms_total"] += infer_ms
+        self.stats["batch_size_max"] = max(self.stats["batch_size_max"], len(texts))
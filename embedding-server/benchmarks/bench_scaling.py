@@ -0,0 +1,132 @@
+"""
+Inference worker scaling benchmark.
+
+Starts a WorkerPool (see workers.py) for each worker count, keeps one batch in
+flight per worker, and reports throughput next to the workers' combined memory.
+RSS counts the shared, memory-mapped weights once per worker; PSS splits shared
+pages between the processes mapping them, so PSS is the number that should stay
+roughly flat as workers are added.
+
+    cd embedding-server
+    python -m benchmarks.bench_scaling --workers 1 2 4 --out scaling.json
+
+The model comes from --model (default: EMBED_MODEL) and must be in the local
+Hugging Face cache.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import BATCH_MAX_SIZE, EMBED_MODEL
+from workers import WorkerPool
+
+SENTENCES = [
+    "We will pay for loss of or damage to your vehicle caused by fire, theft or attempted theft.",
+    "The excess is the first part of any claim that you must pay.",
+    "Cover for personal belongings is limited to £250 in any one period of insurance.",
+    "You must tell us straight away about any change to the information in your schedule.",
+    "Windscreen claims do not affect your no claims discount.",
+    "Driving other cars cover only applies if it is shown on your certificate of motor insurance.",
+]
+
+
+# --- Measurement ---
+def _smaps_mb(pid: int) -> dict:
+    """RSS and PSS of one process in MB, from /proc/<pid>/smaps_rollup (Linux)."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                fields[parts[0][:-1].lower()] = int(parts[1]) / 1024
+    return fields
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def make_batches(count: int, size: int, seed: int = 0) -> list:
+    """Texts of varied length, distinct so nothing is shortcut along the way."""
+    batches = []
+    for b in range(count):
+        batch = []
+        for i in range(size):
+            n = seed + b * size + i
+            words = " ".join(SENTENCES[(n + k) % len(SENTENCES)] for k in range(1 + n % 4))
+            batch.append(f"[{n}] {words}")
+        batches.append(batch)
+    return batches
+
+
+def run_case(model: str, workers: int, threads: int, batches: list) -> dict:
+    start = time.perf_counter()
+    pool = WorkerPool(model, workers, threads)
+    load_seconds = time.perf_counter() - start
+    try:
+        pool.embed_batch(batches[0])  # warm every code path once before timing
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as callers:
+            list(callers.map(pool.embed_batch, batches))
+        seconds = time.perf_counter() - start
+
+        memory = [_smaps_mb(pid) for pid in pool.pids]
+    finally:
+        pool.shutdown()
+
+    texts = sum(len(b) for b in batches)
+    return {
+        "workers": workers,
+        "threads_per_worker": threads,
+        "batches": len(batches),
+        "texts": texts,
+        "load_seconds": round(load_seconds, 2),
+        "seconds": round(seconds, 3),
+        "texts_per_sec": round(texts / seconds, 1),
+        "rss_mb_total": round(sum(m.get("rss", 0) for m in memory), 1),
+        "pss_mb_total": round(sum(m.get("pss", 0) for m in memory), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--model", default=EMBED_MODEL)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, help="torch threads per worker (default: cores / workers)")
+    parser.add_argument("--batches", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=BATCH_MAX_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    cores = os.cpu_count() or 1
+    batches = make_batches(args.batches, args.batch_size, args.seed)
+    results = {"commit": _git_commit(), "model": args.model, "cores": cores, "cases": []}
+
+    for workers in args.workers:
+        threads = args.threads or max(1, cores // workers)
+        case = run_case(args.model, workers, threads, batches)
+        results["cases"].append(case)
+        base = results["cases"][0]["texts_per_sec"]
+        print(f"{workers:>2} workers x {threads:>2} threads  {case['texts_per_sec']:>8} texts/s "
+              f"({case['texts_per_sec'] / base:.2f}x)  rss {case['rss_mb_total']} MB  "
+              f"pss {case['pss_mb_total']} MB")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.out}")
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
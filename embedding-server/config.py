@@ -0,0 +1,49 @@
+import os
+
+# --- Models ---
+# EMBED_MODEL is the default, used when a request names no model. A request for a
+# model that cannot be loaded gets a 404: vectors from another model live in a
+# different space and would silently corrupt an index. STRICT_MODEL=false serves
+# EMBED_MODEL instead (the response's "model" names it). EMBED_MODELS are loaded
+# and warmed before /ready.
+EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBED_MODELS = [m.strip() for m in os.getenv("EMBED_MODELS", EMBED_MODEL).split(",") if m.strip()]
+MAX_MODELS = int(os.getenv("MAX_MODELS", "2"))  # resident models, least recently used evicted first
+STRICT_MODEL = os.getenv("STRICT_MODEL", "true").lower() == "true"
+# A configured model that fails to load (OOM, download error) is retried after
+# MODEL_RETRY_SECONDS, doubling per consecutive failure up to MODEL_RETRY_MAX_SECONDS.
+MODEL_RETRY_SECONDS = float(os.getenv("MODEL_RETRY_SECONDS", "30"))
+MODEL_RETRY_MAX_SECONDS = float(os.getenv("MODEL_RETRY_MAX_SECONDS", "600"))
+
+MAX_TOKEN = int(os.getenv("MAX_TOKEN", "384"))
+
+# --- Batching ---
+# Concurrent requests share a forward pass of up to BATCH_MAX_SIZE texts,
+# waiting at most BATCH_MAX_WAIT_MS to fill it.
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "64"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+# Inputs are sorted by token length and run in sub-batches of this many texts,
+# so short texts are not padded out to the longest one in the batch.
+BUCKET_SIZE = int(os.getenv("BUCKET_SIZE", "16"))
+
+# --- Inference backend ---
+# torch | onnx | onnx-int8. ONNX backends are checked against torch at load
+# and fall back to torch if any probe vector drops below DRIFT_MIN_COSINE.
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+DRIFT_CHECK = os.getenv("DRIFT_CHECK", "true").lower() == "true"
+DRIFT_MIN_COSINE = float(os.getenv("DRIFT_MIN_COSINE", "0.98"))
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "/root/.cache/huggingface/onnx")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 lets ONNX Runtime decide; workers use INFERENCE_THREADS
+
+# --- Multi-process inference ---
+# INFERENCE_WORKERS > 0 runs each model in that many worker processes, sharing one
+# memory-mapped copy of the weights; each worker gets INFERENCE_THREADS torch threads.
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", max(1, (os.cpu_count() or 1) // max(1, INFERENCE_WORKERS))))
+
+# --- Reranking ---
+# Cross-encoder served at /v1/rerank, loaded on first use. Pairs from concurrent
+# requests share forward passes, like embeddings. Empty disables the endpoint.
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_MAX_TOKEN = int(os.getenv("RERANK_MAX_TOKEN", "512"))
+RERANK_WARMUP = os.getenv("RERANK_WARMUP", "false").lower() == "true"  # load at startup, not first request
@@ -1,10 +1,14 @@
-import os
-import torch
-from fastapi import FastAPI, HTTPException, Request
+import asyncio
+import base64
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import Union, List
-from transformers import AutoTokenizer, AutoModel
+from typing import Literal, Optional, Union, List
+
+from config import RERANK_MODEL, RERANK_WARMUP
+from registry import ModelRegistry, UnknownModel
+from reranker import Reranker
 
 app = FastAPI()
 
@@ -17,38 +21,65 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global model/tokenizer
-tokenizer = None
-model = None
+# Models are loaded by request name and kept in a bounded LRU set (see registry.py)
+registry = ModelRegistry()
+# Cross-encoder for /v1/rerank, loaded on first use (see reranker.py)
+reranker = Reranker() if RERANK_MODEL else None
 
-MAX_TOKEN = int(os.getenv("MAX_TOKEN", "384"))
 
 @app.on_event("startup")
-async def load_model():
-    """Load HuggingFace embedding model once at startup."""
-    global tokenizer, model
-    model_name = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
-    print(f"🚀 Loading embedding model: {model_name}")
-    tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
-    model = AutoModel.from_pretrained(model_name, local_files_only=True)
-    model.eval()
-    print("✅ Model loaded successfully!")
+async def load_models():
+    """Load and warm the configured models in the background; /ready flips once done."""
+    asyncio.create_task(registry.warmup())
+    if reranker and RERANK_WARMUP:
+        asyncio.create_task(reranker.get())
+
+
+@app.on_event("shutdown")
+async def stop_models():
+    await registry.stop()
+    if reranker:
+        await reranker.stop()
+
+
+@app.get("/ready")
+async def ready():
+    """200 once every configured model is loaded and warmed, 503 before."""
+    if not registry.ready:
+        return JSONResponse({"ready": False, "resident": list(registry.models)}, status_code=503)
+    return {"ready": True, "resident": list(registry.models)}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Per-model batching stats (batch sizes, queue wait, inference time), backend and drift."""
+    stats = registry.metrics()
+    if reranker:
+        stats["rerank"] = reranker.metrics()
+    return stats
 
 
 # --- OpenAI-style request schema ---
 class EmbeddingRequest(BaseModel):
     model: str
     input: Union[str, List[str]]  # OpenAI allows string or list of strings
+    # "base64" returns each vector as base64 of little-endian float32 bytes (as OpenAI does);
+    # dtype="float16" halves that again (non-standard, for our own clients)
+    encoding_format: Literal["float", "base64"] = "float"
+    dtype: Literal["float32", "float16"] = "float32"
+
+
+def encode_embedding(vector, encoding_format: str, dtype: str):
+    if encoding_format == "base64":
+        raw = vector.astype("<f2" if dtype == "float16" else "<f4").tobytes()
+        return base64.b64encode(raw).decode("ascii")
+    return vector.tolist()
 
 
 @app.post("/v1/embeddings")
-async def create_embeddings(req: EmbeddingRequest, request: Request):
+async def create_embeddings(req: EmbeddingRequest):
     """OpenAI-compatible embeddings endpoint."""
 
-    # Debug raw body (optional, can comment out later)
-    body = await request.json()
-    #print("📩 RAW REQUEST:", body)
-
     # Normalize input → always a list of strings
     if isinstance(req.input, str):
         texts = [req.input]
@@ -58,34 +89,70 @@ async def create_embeddings(req: EmbeddingRequest, request: Request):
         texts = req.input
     else:
         raise HTTPException(status_code=400, detail="Invalid input type")
+    if not texts:
+        raise HTTPException(status_code=422, detail="Input must not be empty")
 
-    # Tokenize
-    inputs = tokenizer(
-        texts,
-        padding=True,
-        truncation=True,
-        max_length=MAX_TOKEN,
-        return_tensors="pt"
-    )
+    try:
+        model = await registry.get(req.model)
+    except UnknownModel:
+        raise HTTPException(status_code=404, detail=f"Model {req.model} is not available")
 
-    # Compute embeddings (mean pooling)
-    with torch.no_grad():
-        embeddings = model(**inputs).last_hidden_state.mean(dim=1).tolist()
+    # Queued and coalesced with concurrent requests into one forward pass
+    results = await model.embed(texts)
 
     # Build OpenAI-style response
     data = [
-        {"object": "embedding", "embedding": emb, "index": i}
-        for i, emb in enumerate(embeddings)
+        {"object": "embedding", "embedding": encode_embedding(emb, req.encoding_format, req.dtype), "index": i}
+        for i, (emb, _) in enumerate(results)
     ]
 
+    tokens = int(sum(n for _, n in results))
     usage = {
-        "prompt_tokens": int(inputs["input_ids"].numel()),
-        "total_tokens": int(inputs["input_ids"].numel()),
+        "prompt_tokens": tokens,
+        "total_tokens": tokens,
     }
 
-    return {
+    # Already JSON-ready; skip FastAPI's recursive jsonable_encoder pass
+    return JSONResponse({
         "object": "list",
         "data": data,
-        "model": req.model,
+        "model": model.name,  # the model actually used, which may be the fallback
         "usage": usage,
-    }
+    })
+
+
+# --- Rerank (Cohere/Jina-style) ---
+class RerankRequest(BaseModel):
+    model: Optional[str] = None
+    query: str
+    documents: List[str]
+    top_n: Optional[int] = None  # default: every document
+    return_documents: bool = False
+
+
+@app.post("/v1/rerank")
+async def rerank(req: RerankRequest):
+    """Score each document against the query with the cross-encoder, best first."""
+    if not reranker or not reranker.accepts(req.model):
+        raise HTTPException(status_code=404, detail=f"Rerank model {req.model or RERANK_MODEL} is not available")
+    if not req.documents:
+        return JSONResponse({"model": reranker.name, "results": [], "usage": {"total_tokens": 0}})
+
+    try:
+        model = await reranker.get()
+    except Exception as e:
+        print(f"❌ Could not load rerank model {reranker.name}: {e}")
+        raise HTTPException(status_code=503, detail=f"Rerank model {reranker.name} could not be loaded")
+    # Pairs from concurrent requests are coalesced into shared forward passes
+    scored = await model.score(req.query, req.documents)
+
+    order = sorted(range(len(scored)), key=lambda i: scored[i][0], reverse=True)
+    results = []
+    for i in order[:req.top_n or len(order)]:
+        item = {"index": i, "relevance_score": scored[i][0]}
+        if req.return_documents:
+            item["document"] = {"text": req.documents[i]}
+        results.append(item)
+
+    tokens = int(sum(n for _, n in scored))
+    return JSONResponse({"model": model.name, "results": results, "usage": {"total_tokens": tokens}})
@@ -0,0 +1,189 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from transformers import AutoTokenizer
+
+from backends import embed_texts, load_model_backend, prepare_backend
+from batcher import DynamicBatcher
+from config import (
+    EMBED_MODEL, EMBED_MODELS, MAX_MODELS, STRICT_MODEL, MODEL_RETRY_SECONDS, MODEL_RETRY_MAX_SECONDS,
+    BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, INFERENCE_WORKERS, INFERENCE_THREADS,
+)
+from workers import WorkerPool
+
+WARMUP_TEXTS = [
+    "warmup",
+    "What does my policy cover?",
+    "We will not pay for loss or damage caused by wear and tear, corrosion or gradual deterioration "
+    "of the insured vehicle or any of its parts.",
+]
+
+
+class UnknownModel(Exception):
+    pass
+
+
+class EmbeddingModel:
+    """
+    One resident model: tokenizer, inference backend and its own batching scheduler.
+
+    With INFERENCE_WORKERS > 0 the forward pass runs in a pool of worker
+    processes on shared weights, and the batcher keeps one batch in flight per worker.
+    """
+
+    def __init__(self, name: str):
+        print(f"🚀 Loading embedding model: {name}")
+        self.name = name
+        self.tokenizer = AutoTokenizer.from_pretrained(name, local_files_only=True)
+        self.pool = None
+        self.drift = None
+
+        if INFERENCE_WORKERS > 0:
+            # Export once here; N workers exporting at the same time would race on the cache
+            prepare_backend(name, self.tokenizer)
+            self.pool = WorkerPool(name, INFERENCE_WORKERS, INFERENCE_THREADS)
+            self.backend = self.pool
+        else:
+            self.backend, self.drift = load_model_backend(name, self.tokenizer)
+
+        self.batcher = DynamicBatcher(self.embed_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS,
+                                      concurrency=max(1, INFERENCE_WORKERS))
+        self.active = 0  # requests waiting on this model; it is not evicted while > 0
+        print(f"✅ Model loaded successfully! ({name}, backend: {self.backend.name})")
+
+    def embed_batch(self, texts):
+        """(float32 vector, token_count) per text, in order."""
+        if self.pool:
+            return self.pool.embed_batch(texts)
+        return embed_texts(self.tokenizer, self.backend, texts)
+
+    async def embed(self, texts):
+        self.active += 1
+        try:
+            return await self.batcher.submit(texts)
+        finally:
+            self.active -= 1
+
+    async def stop(self):
+        await self.batcher.stop()
+        if self.pool:
+            self.pool.shutdown()
+
+    def metrics(self) -> dict:
+        stats = {**self.batcher.metrics(), "backend": self.backend.name, "drift": self.drift}
+        if self.pool:
+            stats["worker_pids"] = self.pool.pids
+        return stats
+
+
+class ModelRegistry:
+    """
+    Models loaded on demand by request name, at most max_models resident.
+
+    The least recently used model is evicted to make room (never the default,
+    and never one with requests in flight). A request for a model that cannot
+    be loaded raises UnknownModel, or is served by the default model when
+    strict is off. Load failures of configured models are remembered with a
+    backoff and retried after it; other names are not remembered, so callers
+    cannot grow the registry's state by sending arbitrary names.
+    """
+
+    def __init__(self, default: str = EMBED_MODEL, preload=EMBED_MODELS,
+                 max_models: int = MAX_MODELS, strict: bool = STRICT_MODEL):
+        self.default = default
+        self.preload = list(dict.fromkeys([default, *preload]))
+        self.max_models = max(1, max_models)
+        self.strict = strict
+        self.models = OrderedDict()  # name -> EmbeddingModel, least recently used first
+        self.failed = {}  # configured name -> (consecutive failures, monotonic time to retry)
+        self.locks = {}
+        self.ready = False
+
+    def resolve(self, name: str) -> str:
+        """Accept short names ("all-MiniLM-L6-v2") for known org/model names."""
+        if not name or name in self.models or "/" in name:
+            return name or self.default
+        for known in [*self.models, *self.preload]:
+            if known.rsplit("/", 1)[-1] == name:
+                return known
+        return name
+
+    async def get(self, name: str) -> EmbeddingModel:
+        name = self.resolve(name)
+        if name in self.models:
+            self.models.move_to_end(name)
+            return self.models[name]
+
+        if name in self.failed and time.monotonic() < self.failed[name][1]:
+            return await self._fallback(name)
+
+        lock = self.locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            if name not in self.models:
+                try:
+                    model = await asyncio.to_thread(EmbeddingModel, name)
+                except Exception as e:
+                    print(f"❌ Could not load model {name}: {e}")
+                    self._record_failure(name)
+                    return await self._fallback(name)
+                model.batcher.start()
+                self.models[name] = model
+                self.failed.pop(name, None)
+                await self._evict(keep=name)
+        return await self.get(name)
+
+    def _record_failure(self, name: str):
+        if name not in self.preload:
+            self.locks.pop(name, None)  # keep no per-name state for unknown names
+            return
+        failures = self.failed.get(name, (0, 0))[0] + 1
+        delay = min(MODEL_RETRY_SECONDS * 2 ** (failures - 1), MODEL_RETRY_MAX_SECONDS)
+        self.failed[name] = (failures, time.monotonic() + delay)
+        print(f"⏳ Retrying {name} in {delay:.0f}s (failure {failures})")
+
+    async def _fallback(self, name: str) -> EmbeddingModel:
+        if self.strict or name == self.default:
+            raise UnknownModel(name)
+        print(f"⚠️ Model {name} unavailable, serving {self.default}")
+        return await self.get(self.default)
+
+    async def _evict(self, keep: str):
+        while len(self.models) > self.max_models:
+            victim = next((n for n, m in self.models.items()
+                           if n not in (self.default, keep) and not m.active), None)
+            if victim is None:
+                return  # everything else is busy; try again on the next load
+            model = self.models.pop(victim)
+            await model.stop()
+            print(f"♻️ Evicted model {victim}")
+
+    async def warmup(self):
+        """Load and warm every configured model, then report ready."""
+        for name in self.preload:
+            try:
+                model = await self.get(name)
+                if model.name != self.resolve(name):
+                    raise UnknownModel(name)  # fell back to the default
+                await model.embed(WARMUP_TEXTS)
+                print(f"🔥 Warmed {model.name}")
+            except Exception as e:
+                print(f"❌ Warmup failed for {name}: {e}")
+                return
+        self.ready = True
+
+    async def stop(self):
+        for model in self.models.values():
+            await model.stop()
+
+    def metrics(self) -> dict:
+        return {
+            "ready": self.ready,
+            "default": self.default,
+            "resident": list(self.models),
+            "failed": {
+                name: {"failures": n, "retry_in_seconds": max(0.0, round(at - time.monotonic(), 1))}
+                for name, (n, at) in self.failed.items()
+            },
+            "models": {name: m.metrics() for name, m in self.models.items()},
+        }
@@ -0,0 +1,83 @@
+import asyncio
+
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from batcher import DynamicBatcher
+from config import RERANK_MODEL, RERANK_MAX_TOKEN, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, BUCKET_SIZE
+
+
+class RerankModel:
+    """
+    Cross-encoder scoring (query, document) pairs, with its own batching scheduler.
+
+    Scores are the raw relevance logits, as sentence-transformers' CrossEncoder
+    returns them for the ms-marco models, so thresholds tuned against that carry over.
+    """
+
+    def __init__(self, name: str):
+        print(f"🚀 Loading rerank model: {name}")
+        self.name = name
+        self.tokenizer = AutoTokenizer.from_pretrained(name, local_files_only=True)
+        self.model = AutoModelForSequenceClassification.from_pretrained(name, local_files_only=True)
+        self.model.eval()
+        self.batcher = DynamicBatcher(self.score_pairs, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS)
+        print(f"✅ Rerank model loaded successfully! ({name})")
+
+    def score_pairs(self, pairs):
+        """
+        Score pairs in length-sorted sub-batches. Returns (score, token_count)
+        per pair, in the original order.
+        """
+        encoded = self.tokenizer([q for q, _ in pairs], [d for _, d in pairs],
+                                 truncation="longest_first", max_length=RERANK_MAX_TOKEN)
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+        order = sorted(range(len(pairs)), key=lengths.__getitem__)
+
+        results = [None] * len(pairs)
+        for start in range(0, len(order), BUCKET_SIZE):
+            bucket = order[start:start + BUCKET_SIZE]
+            features = self.tokenizer.pad(
+                {k: [encoded[k][i] for i in bucket] for k in encoded.keys()},
+                return_tensors="pt",
+            )
+            with torch.no_grad():
+                logits = self.model(**features).logits
+            for i, score in zip(bucket, logits[:, 0].tolist()):
+                results[i] = (score, lengths[i])
+        return results
+
+    async def score(self, query: str, documents: list):
+        return await self.batcher.submit([(query, d) for d in documents])
+
+    def metrics(self) -> dict:
+        return {**self.batcher.metrics(), "model": self.name}
+
+
+class Reranker:
+    """The configured rerank model, loaded once on first use."""
+
+    def __init__(self, name: str = RERANK_MODEL):
+        self.name = name
+        self.model = None
+        self.lock = asyncio.Lock()
+
+    def accepts(self, name) -> bool:
+        """Requests may name the model in full, by its short name, or not at all."""
+        return not name or name in (self.name, self.name.rsplit("/", 1)[-1])
+
+    async def get(self) -> RerankModel:
+        if self.model is None:
+            async with self.lock:
+                if self.model is None:
+                    model = await asyncio.to_thread(RerankModel, self.name)
+                    model.batcher.start()
+                    self.model = model
+        return self.model
+
+    async def stop(self):
+        if self.model:
+            await self.model.batcher.stop()
+
+    def metrics(self) -> dict:
+        return self.model.metrics() if self.model else {"model": self.name, "loaded": False}
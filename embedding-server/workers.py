@@ -0,0 +1,65 @@
+"""
+Inference worker processes for one model.
+
+Each worker loads the tokenizer and the configured backend once, with torch
+weights memory-mapped from the model's safetensors file (see
+backends.mmap_state_dict), so N workers add roughly one copy of the weights
+rather than N. Workers are spawned, not forked, and each is limited to
+`threads` intra-op threads (torch and ONNX Runtime) so N workers do not
+oversubscribe the cores. ONNX exports must already exist (see
+backends.prepare_backend); workers only open them.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+_tokenizer = None
+_backend = None
+
+
+def _init_worker(model_name: str, threads: int):
+    global _tokenizer, _backend
+    import torch
+    from transformers import AutoTokenizer
+
+    from backends import load_model_backend
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    _tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
+    _backend, _ = load_model_backend(model_name, _tokenizer, shared=True, threads=threads)
+    print(f"👷 Inference worker {os.getpid()} ready for {model_name} ({threads} threads)")
+
+
+def _embed(texts):
+    from backends import embed_texts
+
+    return embed_texts(_tokenizer, _backend, texts)
+
+
+def _pid(_):
+    return os.getpid()
+
+
+class WorkerPool:
+    """A process pool serving embed_texts for one model."""
+
+    def __init__(self, model_name: str, workers: int, threads: int):
+        self.model_name = model_name
+        self.workers = workers
+        self.threads = threads
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, threads),
+        )
+        # Start every worker now so loading (and failures) happen before serving
+        self.pids = sorted(set(self.pool.map(_pid, range(workers * 4))))
+        self.name = f"{workers} workers"
+
+    def embed_batch(self, texts):
+        return self.pool.submit(_embed, texts).result()
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
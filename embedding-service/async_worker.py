@@ -0,0 +1,205 @@
+"""
+asyncio embedding worker: python -u async_worker.py
+
+Same queue, cache, Chroma collection and progress accounting as embed_worker,
+but deliveries are gathered into batches that run concurrently: up to
+EMBED_INFLIGHT batches are embedding over a pooled keep-alive HTTP client while
+earlier ones are being written to Chroma (in worker threads). Each batch is
+written, counted and acked on its own, so the persist-then-ack guarantees of
+the sync worker hold per batch. As there, a chunk that cannot be embedded only
+fails the delivery it came from.
+"""
+import asyncio
+import os
+import time
+
+import aio_pika
+import httpx
+
+from config import (
+    EMBED_BATCH_MAX, EMBED_BATCH_WAIT_MS, EMBED_PREFETCH, EMBED_REQUEST_TIMEOUT,
+    EMBED_INFLIGHT, EMBED_HTTP_POOL,
+)
+from progress import group_by_job
+from embed_worker import (
+    RABBITMQ_HOST, RABBITMQ_USER, RABBITMQ_PASS, QUEUE_NAME, EMBED_MODEL, EMBEDDINGS_URL,
+    collection, progress, embed_payload, lookup_cached, fill_vectors, chunk_record, message_items,
+    sync_document,
+)
+
+
+def is_sync(item: dict) -> bool:
+    return item.get("type") == "sync"
+
+
+def persist(chunks: list, vectors: list, syncs: list):
+    """Blocking part of a batch: upsert, count progress, then reconcile finished documents."""
+    if chunks:
+        records = [chunk_record(c) for c in chunks]
+        collection.upsert(
+            ids=[doc_id for doc_id, _ in records],
+            embeddings=vectors,
+            documents=[c["text"] for c in chunks],
+            metadatas=[meta for _, meta in records],
+        )
+        progress.add_many(group_by_job(
+            ((os.path.basename(c["key"]), c["total_chunks"]), doc_id) for c, (doc_id, _) in zip(chunks, records)
+        ))
+    for item in syncs:
+        sync_document(item)
+
+
+class AsyncEmbedWorker:
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            timeout=EMBED_REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=EMBED_HTTP_POOL, max_keepalive_connections=EMBED_HTTP_POOL),
+        )
+        self.inflight = asyncio.Semaphore(EMBED_INFLIGHT)
+        self.syncing = {}  # key -> batch task that will run that document's sync
+        self.tasks = set()  # strong references to running batches
+        self.stats = {"batches": 0, "chunks": 0, "failed_batches": 0, "failed_deliveries": 0}
+
+    # --- Embedding ---
+    async def embed(self, texts: list) -> list:
+        texts, vectors, missing = await asyncio.to_thread(lookup_cached, texts)
+        data = []
+        if missing:
+            resp = await self.client.post(EMBEDDINGS_URL, json=embed_payload(missing))
+            resp.raise_for_status()
+            data = resp.json()["data"]
+        return await asyncio.to_thread(fill_vectors, texts, vectors, missing, data)
+
+    async def embed_each(self, chunks: list, owners: list) -> tuple:
+        """Fallback after a failed batch call: one request per chunk. Returns (vectors, failed owners)."""
+        vectors, failed = [], set()
+        for chunk, owner in zip(chunks, owners):
+            vector = None
+            if owner not in failed:
+                try:
+                    vector = (await self.embed([chunk["text"]]))[0]
+                except Exception as e:
+                    print(f"❌ Failed embedding {chunk.get('filename')} chunk {chunk.get('chunk_id')}: {e}")
+                    failed.add(owner)
+            vectors.append(vector)
+        return vectors, failed
+
+    # --- Batches ---
+    async def run_batch(self, messages: list, items: list, owners: list):
+        """owners[i] is the index in messages of the delivery items[i] came from."""
+        start = time.perf_counter()
+        chunks = [(o, i) for o, i in zip(owners, items) if not is_sync(i)]
+        failed = set()
+        try:
+            vectors = []
+            if chunks:
+                try:
+                    vectors = await self.embed([c["text"] for _, c in chunks])
+                except Exception as e:
+                    print(f"⚠️ Batch embedding of {len(chunks)} chunks failed ({e}), falling back to single requests")
+                    vectors, failed = await self.embed_each([c for _, c in chunks], [o for o, _ in chunks])
+
+            kept = [(c, v) for (o, c), v in zip(chunks, vectors) if o not in failed]
+            syncs = [i for o, i in zip(owners, items) if is_sync(i) and o not in failed]
+            await asyncio.to_thread(persist, [c for c, _ in kept], [v for _, v in kept], syncs)
+            for n, m in enumerate(messages):
+                if n in failed:
+                    await m.nack(requeue=not m.redelivered)
+                else:
+                    await m.ack()
+            self.stats["batches"] += 1
+            self.stats["chunks"] += len(kept)
+            self.stats["failed_deliveries"] += len(failed)
+            print(f"📦 Embedded and stored {len(kept)} chunks in {time.perf_counter() - start:.2f}s"
+                  + (f", {len(failed)} deliveries failed" if failed else ""))
+        except Exception as e:
+            # Requeue once; a second failure drops the delivery so a poison message cannot loop
+            self.stats["failed_batches"] += 1
+            print(f"❌ Batch of {len(chunks)} chunks failed: {e}")
+            for m in messages:
+                await m.nack(requeue=not m.redelivered)
+        finally:
+            self.inflight.release()
+
+    async def dispatch(self, messages: list, items: list, owners: list):
+        # A new version of a document must not be written while an older sync for
+        # the same key is still pending, or that sync would delete the new chunks.
+        keys = {i["key"] for i in items if not is_sync(i)}
+        waits = {self.syncing[k] for k in keys if k in self.syncing}
+        if waits:
+            await asyncio.wait(waits)
+
+        await self.inflight.acquire()
+        task = asyncio.create_task(self.run_batch(messages, items, owners))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        for item in items:
+            if is_sync(item):
+                key = item["key"]
+                self.syncing[key] = task
+                task.add_done_callback(lambda t, k=key: self.syncing.get(k) is t and self.syncing.pop(k))
+
+    # --- Consuming ---
+    async def gather(self, pending: asyncio.Queue):
+        """
+        Wait for one delivery, then collect more until EMBED_BATCH_MAX chunks or the
+        wait runs out. Returns (messages, items, owners): owners[i] is the index in
+        messages that items[i] came from.
+        """
+        loop = asyncio.get_running_loop()
+        messages, items, owners, deadline = [], [], [], None
+        while True:
+            timeout = None if deadline is None else deadline - loop.time()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                message = await asyncio.wait_for(pending.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            try:
+                new = message_items(message.body)
+            except Exception as e:
+                print(f"❌ Unreadable message: {e}")
+                await message.reject(requeue=False)
+                continue
+            items.extend(new)
+            owners.extend([len(messages)] * len(new))
+            messages.append(message)
+            deadline = deadline or loop.time() + EMBED_BATCH_WAIT_MS / 1000
+            if sum(1 for i in items if not is_sync(i)) >= EMBED_BATCH_MAX:
+                break
+        return messages, items, owners
+
+    async def consume(self):
+        connection = await aio_pika.connect_robust(
+            host=RABBITMQ_HOST, login=RABBITMQ_USER, password=RABBITMQ_PASS, heartbeat=60,
+        )
+        async with connection:
+            channel = await connection.channel()
+            await channel.set_qos(prefetch_count=EMBED_PREFETCH)
+            queue = await channel.declare_queue(QUEUE_NAME, durable=True)
+
+            pending = asyncio.Queue()
+            await queue.consume(pending.put)
+            print(f"🚀 Async embedding worker started ({EMBED_INFLIGHT} batches in flight, "
+                  f"up to {EMBED_BATCH_MAX} chunks each), waiting for messages...")
+
+            while True:
+                messages, items, owners = await self.gather(pending)
+                if messages:
+                    await self.dispatch(messages, items, owners)
+
+
+async def main():
+    worker = AsyncEmbedWorker()
+    while True:
+        try:
+            await worker.consume()
+        except Exception as e:
+            print(f"⚠️ Async embedding worker error: {e}, retrying in 5s...")
+            await asyncio.sleep(5)
+
+
+if __name__ == "__main__":
+    print(f"EMBEDDING: Starting async worker with model {EMBED_MODEL}")
+    asyncio.run(main())
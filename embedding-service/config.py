@@ -0,0 +1,33 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Embedding cache ---
+EMBED_CACHE = os.getenv("EMBED_CACHE", "true").lower() == "true"
+EMBED_CACHE_TTL = int(os.getenv("EMBED_CACHE_TTL", 60 * 60 * 24 * 30))
+# Optional local on-disk tier (SQLite), consulted before Redis. Empty disables it.
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "")
+EMBED_CACHE_DISK_MAX_ROWS = int(os.getenv("EMBED_CACHE_DISK_MAX_ROWS", 200000))
+EMBED_CACHE_LOG_INTERVAL = float(os.getenv("EMBED_CACHE_LOG_INTERVAL", 60))  # seconds between hit-rate logs
+
+# --- Micro-batching consumer ---
+# "batch" gathers deliveries into one /v1/embeddings call; "single" is one chunk per call.
+CONSUMER_MODE = os.getenv("CONSUMER_MODE", "batch")
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", 64))  # chunks per embeddings call
+EMBED_BATCH_WAIT_MS = int(os.getenv("EMBED_BATCH_WAIT_MS", 50))  # max wait to fill a batch
+EMBED_PREFETCH = int(os.getenv("EMBED_PREFETCH", EMBED_BATCH_MAX))  # unacked deliveries
+EMBED_REQUEST_TIMEOUT = int(os.getenv("EMBED_REQUEST_TIMEOUT", 60))
+# Buffered vectors are written to Chroma once BATCH_SIZE are waiting or the oldest is this old
+EMBED_FLUSH_MAX_AGE = float(os.getenv("EMBED_FLUSH_MAX_AGE", 1.0))
+
+# --- Async worker (async_worker.py) ---
+# Embedding batches in flight at once; prefetch should cover EMBED_INFLIGHT full batches.
+EMBED_INFLIGHT = int(os.getenv("EMBED_INFLIGHT", 4))
+EMBED_HTTP_POOL = int(os.getenv("EMBED_HTTP_POOL", EMBED_INFLIGHT))  # keep-alive connections
+
+# --- Embeddings response encoding ---
+# "base64" asks for base64 little-endian vectors instead of JSON float arrays;
+# EMBED_DTYPE=float16 halves the payload again (our embedding-server only).
+EMBED_ENCODING_FORMAT = os.getenv("EMBED_ENCODING_FORMAT", "base64")
+EMBED_DTYPE = os.getenv("EMBED_DTYPE", "float32")
@@ -1,13 +1,22 @@
+import base64
 import os
 import requests
 import json
 import time
+import numpy as np
 import pika
 import redis
 from chromadb import HttpClient
 from huggingface_hub import login
 from dotenv import load_dotenv
 
+from config import (
+    EMBED_CACHE, CONSUMER_MODE, EMBED_BATCH_MAX, EMBED_BATCH_WAIT_MS, EMBED_PREFETCH,
+    EMBED_REQUEST_TIMEOUT, EMBED_FLUSH_MAX_AGE, EMBED_ENCODING_FORMAT, EMBED_DTYPE,
+)
+from embedding_cache import EmbeddingCache
+from progress import JobProgress, group_by_job
+
 # --- Load env ---
 load_dotenv()
 
@@ -20,6 +29,7 @@ if hf_token:
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+progress = JobProgress(r)
 
 # --- RabbitMQ ---
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
@@ -36,16 +46,23 @@ chroma_client = HttpClient(host=VECTOR_DB_HOST, port=VECTOR_DB_PORT)
 collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
 
 # --- Embeddings ---
-EMBED_MODEL = os.getenv("EMBED_MODEL", "mixedbread-ai/mxbai-embed-large-v1")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 EMBEDDINGS_URL = os.getenv("EMBEDDINGS_URL")
 
 print(f"🔗 Using embeddings model: {EMBED_MODEL}")
 
+# Keep-alive connection pool to the embeddings server
+http = requests.Session()
+
+embed_cache = EmbeddingCache(REDIS_HOST, REDIS_PORT) if EMBED_CACHE else None
+
 # --- Globals ---
 _embedding_dim_cache = None
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", 32))
 
-_batch = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+# Vectors waiting to be written; "jobs" holds (job_id, total_chunks) per entry for progress
+_batch = {"ids": [], "embeddings": [], "documents": [], "metadatas": [], "jobs": []}
+_batch_started = None  # monotonic time the oldest buffered vector was added
 
 # --- Helpers ---
 def sanitize_metadata(meta: dict) -> dict:
@@ -60,56 +77,105 @@ def sanitize_metadata(meta: dict) -> dict:
     return clean
 
 
-def update_progress(job_id, total_chunks):
-    job_key = f"job:{job_id}"
+def embed_payload(texts: list) -> dict:
+    payload = {"model": EMBED_MODEL, "input": texts, "encoding_format": EMBED_ENCODING_FORMAT}
+    if EMBED_DTYPE != "float32":
+        payload["dtype"] = EMBED_DTYPE
+    return payload
 
-    if not r.exists(job_key):
-        print(f"⚠️ Redis job {job_key} not found — creating placeholder")
-        r.hset(job_key, mapping={
-            "status": "processing",
-            "total_chunks": total_chunks,
-            "chunks_done": 0,
-            "created_at": time.time()
-        })
 
-    new_done = r.hincrby(job_key, "chunks_done", 1)
-    r.hset(job_key, "updated_at", time.time())
+def decode_embedding(value) -> list:
+    """Vectors arrive as float lists or as base64 little-endian float32/float16 bytes."""
+    if isinstance(value, str):
+        dtype = "<f2" if EMBED_DTYPE == "float16" else "<f4"
+        return np.frombuffer(base64.b64decode(value), dtype=dtype).astype(np.float32).tolist()
+    return value
 
-    total = r.hget(job_key, "total_chunks")
-    print(f"📊 Progress for {job_id}: {new_done}/{total}")
 
-    if new_done >= int(total):
-        r.hset(job_key, "status", "complete")
-        print(f"✅ Job {job_id} marked complete in Redis")
+def lookup_cached(texts: list):
+    """Normalise texts and fill what the cache has. Returns (texts, vectors, missing)."""
+    texts = [(t or "").strip() for t in texts]
+    vectors = [None] * len(texts)
+    todo = [i for i, t in enumerate(texts) if t]
 
+    if embed_cache and todo:
+        for i, v in zip(todo, embed_cache.get_many(EMBED_MODEL, [texts[i] for i in todo])):
+            vectors[i] = v
 
-def embed_text(text: str):
-    global _embedding_dim_cache
+    missing = list(dict.fromkeys(texts[i] for i in todo if vectors[i] is None))
+    return texts, vectors, missing
 
-    text = (text or "").strip()
-    if not text:
-        print("⚠️ Skipping empty text embedding")
-        return [0.0] * (_embedding_dim_cache or 384)
 
-    payload = {"model": EMBED_MODEL, "input": text}
-    resp = requests.post(EMBEDDINGS_URL, json=payload, timeout=30)
-    resp.raise_for_status()
+def fill_vectors(texts: list, vectors: list, missing: list, data: list) -> list:
+    """Merge an embeddings response for `missing` into vectors, caching it; empty texts get zeros."""
+    global _embedding_dim_cache
 
-    vector = resp.json()["data"][0]["embedding"]
+    if missing:
+        data = sorted(data, key=lambda d: d["index"])
+        if len(data) != len(missing):
+            raise ValueError(f"Expected {len(missing)} embeddings, got {len(data)}")
+        fresh = dict(zip(missing, (decode_embedding(d["embedding"]) for d in data)))
+        if embed_cache:
+            embed_cache.put_many(EMBED_MODEL, missing, [fresh[t] for t in missing])
+        vectors = [v if v is not None or not t else fresh[t] for t, v in zip(texts, vectors)]
 
     # Detect embedding size once
-    if _embedding_dim_cache is None:
-        _embedding_dim_cache = len(vector)
+    if _embedding_dim_cache is None and missing:
+        _embedding_dim_cache = len(fresh[missing[0]])
         print(f"📐 Detected embedding size: {_embedding_dim_cache}")
 
-    return vector
+    empty = sum(1 for v in vectors if v is None)
+    if empty:
+        print(f"⚠️ Skipping {empty} empty text embedding(s)")
+        zero = [0.0] * (_embedding_dim_cache or 384)
+        vectors = [v if v is not None else list(zero) for v in vectors]
+
+    return vectors
+
+
+def embed_texts(texts: list) -> list:
+    """
+    Embed many texts with a single /v1/embeddings call.
+    Cached texts are served from the cache, duplicates are sent once, and
+    empty texts get a zero vector without a request.
+    """
+    texts, vectors, missing = lookup_cached(texts)
+    data = []
+    if missing:
+        resp = http.post(EMBEDDINGS_URL, json=embed_payload(missing), timeout=EMBED_REQUEST_TIMEOUT)
+        resp.raise_for_status()
+        data = resp.json()["data"]
+    return fill_vectors(texts, vectors, missing, data)
+
+
+def embed_text(text: str):
+    return embed_texts([text])[0]
+
+
+def drop_batch():
+    global _batch_started
+    for k in _batch:
+        _batch[k].clear()
+    _batch_started = None
+
+
+def flush_due() -> bool:
+    if not _batch["ids"]:
+        return False
+    return len(_batch["ids"]) >= BATCH_SIZE or time.monotonic() - _batch_started >= EMBED_FLUSH_MAX_AGE
 
 
 def flush_batch():
+    """
+    Write buffered vectors to Chroma, then count them towards their jobs' progress.
+    Raises if the write fails; the buffer is dropped either way, so the caller must
+    requeue the deliveries it came from.
+    """
     if not _batch["ids"]:
         return
+    jobs = group_by_job(zip(_batch["jobs"], _batch["ids"]))
     try:
-        collection.add(
+        collection.upsert(
             ids=_batch["ids"],
             embeddings=_batch["embeddings"],
             documents=_batch["documents"],
@@ -118,13 +184,43 @@ def flush_batch():
         print(f"✅ Flushed {len(_batch['ids'])} chunks to vector DB")
     except Exception as e:
         print(f"❌ Failed batch insert: {e}")
+        raise
     finally:
-        for k in _batch:
-            _batch[k].clear()
+        drop_batch()
 
+    # Progress only moves once vectors are persisted, so "complete" means queryable
+    progress.add_many(jobs)
 
-def process_message(ch, method, properties, body):
-    msg = json.loads(body)
+
+def chunk_record(msg: dict):
+    """Chroma id and metadata for a chunk message."""
+    key = msg["key"]
+    doc_id = msg.get("doc_id") or f"{key}__{msg['chunk_id']}"
+    # Older ingestion payloads nest chunk_type under "metadata"; their nested
+    # policy_number was only the filename, so it is not trusted as a scope
+    nested = msg.get("metadata") or {}
+    metadata = {
+        "filename": msg["filename"],
+        "key": key,
+        "document_id": msg.get("document_id") or os.path.basename(key),
+        "chunk_id": msg["chunk_id"],
+        "total_chunks": msg["total_chunks"],
+        "policyholder_name": msg.get("policyholder_name"),
+        "policy_number": msg.get("policy_number"),
+        "chunk_type": msg.get("chunk_type") or nested.get("chunk_type"),
+        "policy_type": msg.get("policy_type"),
+        "coverage": msg.get("coverage"),
+        "start_date": msg.get("start_date"),
+        "end_date": msg.get("end_date"),
+        "section": msg.get("section", "GENERAL"),
+        "page_start": msg.get("page_start"),
+        "page_end": msg.get("page_end"),
+    }
+    return doc_id, sanitize_metadata(metadata)
+
+
+def process_chunk(msg: dict, vector=None):
+    global _batch_started
     key = msg["key"]
     filename = msg["filename"]
     chunk_id = msg["chunk_id"]
@@ -134,41 +230,199 @@ def process_message(ch, method, properties, body):
     print(f"🧩 Embedding {filename} [chunk {chunk_id+1}/{total_chunks}]")
 
     try:
-        vector = embed_text(text)
-
-        doc_id = f"{key}__{chunk_id}"
-        metadata = {
-            "filename": filename,
-            "key": key,
-            "chunk_id": chunk_id,
-            "total_chunks": total_chunks,
-            "policyholder_name": msg.get("policyholder_name"),
-            "policy_number": msg.get("policy_number"),
-            "policy_type": msg.get("policy_type"),
-            "coverage": msg.get("coverage"),
-            "start_date": msg.get("start_date"),
-            "end_date": msg.get("end_date"),
-            "section": msg.get("section", "GENERAL"),
-        }
-
-        metadata = sanitize_metadata(metadata)
-
-        # Batch insert
+        if vector is None:
+            vector = embed_text(text)
+
+        doc_id, metadata = chunk_record(msg)
+
+        # Buffered until the next flush; progress is counted there
         _batch["ids"].append(doc_id)
         _batch["embeddings"].append(vector)
         _batch["documents"].append(text)
         _batch["metadatas"].append(metadata)
+        _batch["jobs"].append((os.path.basename(key), total_chunks))
+        _batch_started = _batch_started or time.monotonic()
+
+    except Exception as e:
+        print(f"❌ Failed embedding {filename} chunk {chunk_id}: {e}")
+        raise
 
-        if len(_batch["ids"]) >= BATCH_SIZE:
-            flush_batch()
 
-        job_id = os.path.basename(key)
-        update_progress(job_id, total_chunks)
+def save_manifest(key: str, stored: dict):
+    """Replace manifest:{key} (id -> position), which ingestion diffs re-uploads against."""
+    pipe = r.pipeline()
+    pipe.delete(f"manifest:{key}")
+    if stored:
+        pipe.hset(f"manifest:{key}", mapping=stored)
+    pipe.execute()
 
+
+def sync_document(msg: dict):
+    """
+    Reconcile a document's stored chunks with the ids ingestion says it has now,
+    then record the ids actually stored as the key's manifest. A chunk that never
+    got persisted stays out of the manifest, so the next ingest republishes it.
+    """
+    key = msg["key"]
+    keep = msg["keep"]  # doc_id -> chunk_id
+    total_chunks = msg["total_chunks"]
+
+    try:
+        existing = collection.get(where={"key": key}, include=["metadatas"])
+        stale = [i for i in existing["ids"] if i not in keep]
+        moved = [
+            (i, keep[i]) for i, meta in zip(existing["ids"], existing["metadatas"])
+            if i in keep and (meta.get("chunk_id") != keep[i] or meta.get("total_chunks") != total_chunks)
+        ]
+
+        if stale:
+            collection.delete(ids=stale)
+        if moved:
+            collection.update(
+                ids=[i for i, _ in moved],
+                metadatas=[{"chunk_id": pos, "total_chunks": total_chunks} for _, pos in moved],
+            )
+        stored = {i: keep[i] for i in existing["ids"] if i in keep}
+        save_manifest(key, stored)
+        missing = len(keep) - len(stored)
+        print(f"🔁 Synced {key}: removed {len(stale)} stale chunks, renumbered {len(moved)}"
+              + (f", {missing} not stored yet" if missing else ""))
     except Exception as e:
-        print(f"❌ Failed embedding {filename} chunk {chunk_id}: {e}")
+        print(f"❌ Failed to sync {key}: {e}")
+        raise
 
-    ch.basic_ack(delivery_tag=method.delivery_tag)
+
+def message_items(body) -> list:
+    # Ingestion publishes either one item per message or batch envelopes
+    msg = json.loads(body)
+    return msg["chunks"] if msg.get("type") == "batch" else [msg]
+
+
+def process_items(items: list, owners: list) -> set:
+    """
+    Embed all chunk items in one call, then buffer chunks and run syncs in order.
+
+    owners[i] identifies the delivery items[i] came from. If the batch call fails,
+    chunks are embedded one request at a time; a chunk that still fails marks its
+    owner failed and that owner's remaining items (including its sync) are skipped,
+    so one bad input does not cost the rest of the batch. Returns the failed owners.
+    Sync and flush errors still raise: they are not tied to one input.
+    """
+    chunks = [i for i in items if i.get("type") != "sync"]
+    vectors = [None] * len(chunks)
+    if chunks:
+        try:
+            vectors = embed_texts([c["text"] for c in chunks])
+        except Exception as e:
+            print(f"⚠️ Batch embedding of {len(chunks)} chunks failed ({e}), falling back to single requests")
+
+    failed = set()
+    vectors = iter(vectors)
+    for item, owner in zip(items, owners):
+        if item.get("type") == "sync":
+            if owner in failed:
+                continue
+            # A sync closes out a document: persist its chunks now rather than waiting
+            flush_batch()
+            sync_document(item)
+            continue
+        vector = next(vectors)
+        if owner in failed:
+            continue
+        try:
+            process_chunk(item, vector)
+        except Exception:
+            failed.add(owner)
+    return failed
+
+
+def settle(channel, deliveries: list, ok: bool):
+    """
+    Ack deliveries whose chunks are all persisted, or nack them. Failed deliveries
+    are requeued once; a second failure drops them so a poison message cannot loop.
+    """
+    if not deliveries:
+        return
+    if ok:
+        channel.basic_ack(delivery_tag=deliveries[-1][0], multiple=True)
+        return
+    for tag, redelivered in deliveries:
+        channel.basic_nack(delivery_tag=tag, requeue=not redelivered)
+    dropped = sum(1 for _, redelivered in deliveries if redelivered)
+    print(f"↩️ Requeued {len(deliveries) - dropped} deliveries, dropped {dropped} after retry")
+
+
+def process_message(ch, method, properties, body):
+    delivery = (method.delivery_tag, method.redelivered)
+    try:
+        items = message_items(body)
+    except Exception as e:
+        print(f"❌ Unreadable message: {e}")
+        ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+        return
+    try:
+        ok = not process_items(items, [delivery] * len(items))
+        flush_batch()
+    except Exception:
+        ok = False
+        drop_batch()
+    settle(ch, [delivery], ok)
+
+
+def consume_batched(channel):
+    """
+    Micro-batching consumer: prefetch up to EMBED_PREFETCH deliveries and gather
+    them until EMBED_BATCH_MAX chunks are waiting or EMBED_BATCH_WAIT_MS has passed
+    since the first one arrived, then embed them with one request.
+
+    Vectors are buffered and written to Chroma once BATCH_SIZE are waiting or the
+    oldest is EMBED_FLUSH_MAX_AGE seconds old. Deliveries are acked only after the
+    write that covers all of their chunks has succeeded. A delivery whose chunk
+    cannot be embedded is nacked on its own; unreadable ones are rejected.
+    """
+    wait = EMBED_BATCH_WAIT_MS / 1000
+    channel.basic_qos(prefetch_count=EMBED_PREFETCH)
+
+    items, owners, deadline = [], [], None
+    gathered, buffered = [], []  # (delivery_tag, redelivered) not yet embedded / not yet persisted
+    for method, properties, body in channel.consume(QUEUE_NAME, inactivity_timeout=wait):
+        try:
+            if method is not None:
+                delivery = (method.delivery_tag, method.redelivered)
+                try:
+                    new = message_items(body)
+                except Exception as e:
+                    # Settle it now, or a later multiple ack would silently cover it
+                    print(f"❌ Unreadable message: {e}")
+                    channel.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+                else:
+                    items.extend(new)
+                    owners.extend([delivery] * len(new))
+                    gathered.append(delivery)
+                    deadline = deadline or time.monotonic() + wait
+
+            if gathered:
+                chunk_count = sum(1 for i in items if i.get("type") != "sync")
+                if method is None or chunk_count >= EMBED_BATCH_MAX or time.monotonic() >= deadline:
+                    start = time.perf_counter()
+                    batch, batch_owners, deliveries = items, owners, gathered
+                    items, owners, gathered, deadline = [], [], [], None
+                    buffered += deliveries  # until process_items returns, a raise requeues them all
+                    failed = process_items(batch, batch_owners)
+                    if failed:
+                        buffered = [d for d in buffered if d not in failed]
+                        settle(channel, [d for d in deliveries if d in failed], False)
+                    print(f"📦 Embedded {chunk_count} chunks in {time.perf_counter() - start:.2f}s")
+
+            if flush_due():
+                flush_batch()
+            if buffered and not _batch["ids"]:
+                settle(channel, buffered, True)
+                buffered = []
+        except Exception:
+            drop_batch()
+            settle(channel, buffered + gathered, False)
+            items, owners, deadline, gathered, buffered = [], [], None, [], []
 
 
 def consume():
@@ -180,6 +434,12 @@ def consume():
             channel = connection.channel()
             channel.queue_declare(queue=QUEUE_NAME, durable=True)
 
+            if CONSUMER_MODE == "batch":
+                print(f"🚀 Embedding worker started (batches of up to {EMBED_BATCH_MAX} chunks, "
+                      f"{EMBED_BATCH_WAIT_MS} ms wait), waiting for messages...")
+                consume_batched(channel)
+                continue
+
             channel.basic_qos(prefetch_count=1)
             channel.basic_consume(queue=QUEUE_NAME, on_message_callback=process_message)
 
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import redis
+
+from config import EMBED_CACHE_TTL, EMBED_CACHE_DIR, EMBED_CACHE_DISK_MAX_ROWS, EMBED_CACHE_LOG_INTERVAL
+
+STATS_KEY = "stats:embed_cache"
+
+
+def cache_key(model: str, text: str) -> str:
+    """Content address for a chunk: model name + sha256 of whitespace-normalised text."""
+    normalized = " ".join(text.split())
+    digest = hashlib.sha256(f"{model}\0{normalized}".encode("utf-8")).hexdigest()
+    return f"emb:{model}:{digest}"
+
+
+def _pack(vector) -> bytes:
+    return np.asarray(vector, dtype="<f4").tobytes()
+
+
+def _unpack(raw: bytes) -> list:
+    return np.frombuffer(raw, dtype="<f4").tolist()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache consulted before the embeddings server.
+
+    Lookups go to the optional local SQLite tier first, then Redis; Redis hits are
+    copied down to disk. Vectors are stored as little-endian float32 bytes.
+    Redis errors count as misses, so a Redis outage only costs re-embedding.
+    Hit/miss counters are kept per process in self.stats and aggregated across
+    workers in the Redis hash stats:embed_cache; the hit rate is logged every
+    EMBED_CACHE_LOG_INTERVAL seconds.
+    """
+
+    def __init__(self, host: str, port: int, ttl: int = EMBED_CACHE_TTL,
+                 cache_dir: str = EMBED_CACHE_DIR, max_rows: int = EMBED_CACHE_DISK_MAX_ROWS):
+        self.r = redis.Redis(host=host, port=port)  # binary values, no decoding
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.stats = {"disk_hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0}
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._logged_at = time.monotonic()
+        self.db = None
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.db = sqlite3.connect(os.path.join(cache_dir, "embeddings.sqlite"), check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            print(f"💽 Local embedding cache at {cache_dir}")
+
+    # --- Disk tier ---
+    def _disk_get(self, keys):
+        if not self.db or not keys:
+            return {}
+        with self._lock:
+            rows = self.db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall()
+        return dict(rows)
+
+    def _disk_put(self, items):
+        if not self.db or not items:
+            return
+        with self._lock:
+            self.db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", items)
+            self._puts += len(items)
+            if self._puts >= 1000:
+                self._puts = 0
+                self.db.execute(
+                    "DELETE FROM embeddings WHERE rowid <= (SELECT MAX(rowid) FROM embeddings) - ?",
+                    (self.max_rows,),
+                )
+            self.db.commit()
+
+    # --- Public API ---
+    def get_many(self, model: str, texts: list) -> list:
+        """Return a vector (list of floats) or None for each text."""
+        keys = [cache_key(model, t) for t in texts]
+        found = self._disk_get(keys)
+        disk_hits = len(found)
+
+        missing = [k for k in keys if k not in found]
+        redis_hits = 0
+        if missing:
+            backfill = []
+            try:
+                for k, raw in zip(missing, self.r.mget(missing)):
+                    if raw is not None:
+                        found[k] = raw
+                        backfill.append((k, raw))
+            except redis.RedisError as e:
+                self.stats["redis_errors"] += 1
+                print(f"⚠️ Embedding cache Redis unavailable: {e}")
+            redis_hits = len(backfill)
+            self._disk_put(backfill)
+
+        misses = len(keys) - disk_hits - redis_hits
+        self._count(disk_hits, redis_hits, misses)
+        return [_unpack(found[k]) if k in found else None for k in keys]
+
+    def put_many(self, model: str, texts: list, vectors: list):
+        items = [(cache_key(model, t), _pack(v)) for t, v in zip(texts, vectors)]
+        self._disk_put(items)
+        try:
+            pipe = self.r.pipeline(transaction=False)
+            for k, raw in items:
+                pipe.set(k, raw, ex=self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            self.stats["redis_errors"] += 1
+            print(f"⚠️ Embedding cache Redis unavailable: {e}")
+
+    # --- Stats ---
+    def _count(self, disk_hits: int, redis_hits: int, misses: int):
+        self.stats["disk_hits"] += disk_hits
+        self.stats["redis_hits"] += redis_hits
+        self.stats["misses"] += misses
+        try:
+            pipe = self.r.pipeline(transaction=False)
+            for field, n in (("disk_hits", disk_hits), ("redis_hits", redis_hits), ("misses", misses)):
+                if n:
+                    pipe.hincrby(STATS_KEY, field, n)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+        now = time.monotonic()
+        if now - self._logged_at >= EMBED_CACHE_LOG_INTERVAL:
+            self._logged_at = now
+            print(f"📈 Embedding cache hit rate: {self.hit_rate():.1%} {self.stats}")
+
+    def hit_rate(self) -> float:
+        hits = self.stats["disk_hits"] + self.stats["redis_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
@@ -0,0 +1,75 @@
+import time
+from collections import defaultdict
+
+# Record persisted chunks for a job in one atomic step: create a placeholder if
+# ingestion's job hash is missing, add the chunk ids to job:{id}:done, set
+# chunks_done to the number of distinct ids, timestamp and complete. Counting
+# ids instead of incrementing makes redelivered or republished chunks harmless.
+# KEYS: job hash, done set. ARGV: total_chunks, now, ttl, doc_id...
+# Returns {chunks_done, total_chunks, created placeholder, completed by this call}.
+_PROGRESS = """
+local created = 0
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], 'status', 'processing', 'total_chunks', ARGV[1],
+               'chunks_done', 0, 'created_at', ARGV[2])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    created = 1
+end
+for i = 4, #ARGV do
+    redis.call('SADD', KEYS[2], ARGV[i])
+end
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+local done = redis.call('SCARD', KEYS[2])
+redis.call('HSET', KEYS[1], 'chunks_done', done, 'updated_at', ARGV[2])
+local total = tonumber(redis.call('HGET', KEYS[1], 'total_chunks')) or 0
+local completed = 0
+if done >= total and redis.call('HGET', KEYS[1], 'status') ~= 'complete' then
+    redis.call('HSET', KEYS[1], 'status', 'complete')
+    completed = 1
+end
+return {done, total, created, completed}
+"""
+
+JOB_TTL = 60 * 60 * 24 * 7  # same as ingestion's job hashes
+
+
+def group_by_job(entries) -> dict:
+    """((job_id, total_chunks), doc_id) pairs -> {(job_id, total_chunks): [doc_id, ...]}."""
+    grouped = defaultdict(list)
+    for job, doc_id in entries:
+        grouped[job].append(doc_id)
+    return dict(grouped)
+
+
+class JobProgress:
+    """
+    Job progress in the job:{job_id} hashes that ingestion creates, counted as
+    distinct persisted chunk ids in job:{job_id}:done (ingestion clears it when
+    it starts a new run). Every update is one script call; add_many pipelines a
+    whole flush's jobs into a single round trip.
+    """
+
+    def __init__(self, redis_client):
+        self.r = redis_client
+        self._progress = self.r.register_script(_PROGRESS)
+
+    def add(self, job_id: str, total_chunks: int, doc_ids: list):
+        self.add_many({(job_id, total_chunks): doc_ids})
+
+    def add_many(self, done: dict):
+        """done maps (job_id, total_chunks) -> ids of chunks that are now persisted."""
+        if not done:
+            return
+        now = time.time()
+        pipe = self.r.pipeline(transaction=False)
+        for (job_id, total_chunks), doc_ids in done.items():
+            self._progress(keys=[f"job:{job_id}", f"job:{job_id}:done"],
+                           args=[total_chunks, now, JOB_TTL, *doc_ids], client=pipe)
+        results = pipe.execute()
+
+        for (job_id, _), (count, total, created, completed) in zip(done, results):
+            if created:
+                print(f"⚠️ Redis job job:{job_id} not found — created placeholder")
+            print(f"📊 Progress for {job_id}: {count}/{total}")
+            if completed:
+                print(f"✅ Job {job_id} marked complete in Redis")
@@ -0,0 +1,228 @@
+"""
+Ingestion throughput benchmark.
+
+Runs synthetic policies through the real ingestion stages (S3 streaming,
+extraction, chunking, publishing) with in-memory stand-ins for S3 and RabbitMQ,
+and writes machine-readable results so runs can be compared across commits.
+
+    cd ingestion-service
+    python -m benchmarks.bench_ingest --pages 50 200 --formats pdf docx --out bench.json
+    python -m benchmarks.bench_ingest --pages 50 200 --compare bench.json
+
+The tokenizer comes from --tokenizer (default: EMBED_MODEL), so it must be
+available locally or downloadable. Each case runs in its own spawned process,
+so peak RSS (ru_maxrss, which never goes down) belongs to that case alone.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from transformers import AutoTokenizer
+
+import extraction
+from chunker import legacy_chunk, offset_chunk
+from config import MAX_TOKENS, OVERLAP
+from object_stream import open_object
+from publisher import ChunkPublisher
+from benchmarks.synthetic import make_policy
+
+
+# --- Stand-ins ---
+class _Body(io.BytesIO):
+    def iter_chunks(self, chunk_size):
+        while chunk := self.read(chunk_size):
+            yield chunk
+
+
+class FakeS3:
+    """get_object over an in-memory {key: bytes} store."""
+
+    def __init__(self, objects: dict):
+        self.objects = objects
+
+    def get_object(self, Bucket, Key):
+        data = self.objects[Key]
+        return {"Body": _Body(data), "ContentLength": len(data)}
+
+
+class FakeChannel:
+    """aio-pika channel and connection stand-in: counts publishes, confirms instantly."""
+    is_closed = False
+
+    def __init__(self):
+        self.messages = 0
+        self.default_exchange = self
+
+    async def channel(self, **kwargs):
+        return self
+
+    async def declare_queue(self, name, **kwargs):
+        pass
+
+    async def publish(self, message, routing_key, **kwargs):
+        self.messages += 1
+
+    async def close(self):
+        pass
+
+
+# --- Measurement ---
+def _peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is in KiB on Linux and is a lifetime peak, hence one process per case
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+
+def _distribution(values):
+    if not values:
+        return {}
+    q = statistics.quantiles(values, n=100) if len(values) > 1 else [values[0]] * 99
+    return {
+        "min": min(values), "p50": q[49], "p90": q[89], "p99": q[98], "max": max(values),
+        "mean": round(statistics.fmean(values), 1),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def run_case(fmt: str, pages: int, docs: int, tokenizer, chunker: str, seed: int = 0) -> dict:
+    key_of = lambda i: f"uploads/bench-{pages}p-{i}.{fmt}"
+    s3 = FakeS3({key_of(i): make_policy(fmt, pages, seed + i) for i in range(docs)})
+    channel = FakeChannel()
+
+    async def connect():
+        return channel
+
+    publisher = ChunkPublisher(connect, "bench")
+    chunk_fn = offset_chunk if chunker == "offset" else legacy_chunk
+    baseline_rss = _peak_rss_mb()  # interpreter, imports and tokenizer
+
+    t_extract = t_chunk = t_publish = 0.0
+    page_count, tokens, sizes = 0, 0, []
+
+    for i in range(docs):
+        key = key_of(i)
+        start = time.perf_counter()
+        with open_object(s3, "bench", key) as source:
+            doc_pages = extraction.extract_pages(source, key)
+        text = extraction.join_pages(doc_pages)
+        t_extract += time.perf_counter() - start
+
+        start = time.perf_counter()
+        chunks = extraction.assign_pages(chunk_fn(text, tokenizer, MAX_TOKENS, OVERLAP), doc_pages)
+        t_chunk += time.perf_counter() - start
+
+        start = time.perf_counter()
+        publisher.publish([{"key": key, "chunk_id": n, "text": c["text"]} for n, c in enumerate(chunks)])
+        t_publish += time.perf_counter() - start
+
+        page_count += pages  # DOCX extracts as one page-less entry, so count synthetic pages
+        doc_tokens = len(tokenizer(text, add_special_tokens=False, verbose=False)["input_ids"])
+        tokens += doc_tokens
+        sizes += [c.get("token_count") or len(tokenizer.encode(c["text"], add_special_tokens=False)) for c in chunks]
+
+    publisher.close()
+    if extraction._pool is not None:
+        # Reap the extraction workers so RUSAGE_CHILDREN includes their peak
+        extraction._pool.shutdown()
+        extraction._pool = None
+
+    rate = lambda n, t: round(n / t, 1) if t else None
+    return {
+        "case": f"{fmt}-{pages}p",
+        "format": fmt,
+        "pages_per_doc": pages,
+        "docs": docs,
+        "chunker": chunker,
+        "pages": page_count,
+        "chunks": len(sizes),
+        "tokens": tokens,
+        "extract_seconds": round(t_extract, 3),
+        "chunk_seconds": round(t_chunk, 3),
+        "publish_seconds": round(t_publish, 3),
+        "pages_per_sec": rate(page_count, t_extract),
+        "chunks_per_sec": rate(len(sizes), t_chunk),
+        "tokens_per_sec": rate(tokens, t_chunk),
+        "messages": channel.messages,
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": _peak_rss_mb(),
+        "pool_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "chunk_tokens": _distribution(sizes),
+    }
+
+
+def _isolated_case(fmt: str, pages: int, docs: int, tokenizer_name: str, chunker: str, seed: int) -> dict:
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+    return run_case(fmt, pages, docs, tokenizer, chunker, seed)
+
+
+def run_isolated(*args) -> dict:
+    """run_case in a fresh spawned process (tokenizer loaded there by name)."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_isolated_case, *args).result()
+
+
+def compare(results: dict, baseline_path: str, metrics=("pages_per_sec", "chunks_per_sec", "tokens_per_sec")):
+    with open(baseline_path) as f:
+        baseline = {c["case"]: c for c in json.load(f)["cases"]}
+    print(f"\nvs {baseline_path} ({next(iter(baseline.values()), {}).get('commit', '?')})")
+    for case in results["cases"]:
+        old = baseline.get(case["case"])
+        if not old:
+            continue
+        diffs = []
+        for m in metrics:
+            if old.get(m) and case.get(m):
+                diffs.append(f"{m} {100 * (case[m] - old[m]) / old[m]:+.1f}%")
+        print(f"  {case['case']:<12} " + ", ".join(diffs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--formats", nargs="+", choices=["pdf", "docx"], default=["pdf", "docx"])
+    parser.add_argument("--docs", type=int, default=3, help="documents per case")
+    parser.add_argument("--chunker", choices=["offset", "legacy"], default="offset")
+    parser.add_argument("--tokenizer", default=os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to diff against")
+    args = parser.parse_args(argv)
+
+    commit = _git_commit()
+    results = {"commit": commit, "tokenizer": args.tokenizer, "max_tokens": MAX_TOKENS,
+               "overlap": OVERLAP, "cases": []}
+
+    for fmt in args.formats:
+        for pages in args.pages:
+            case = run_isolated(fmt, pages, args.docs, args.tokenizer, args.chunker, args.seed)
+            case["commit"] = commit
+            results["cases"].append(case)
+            print(f"{case['case']:<12} {case['pages_per_sec']:>8} pages/s  {case['chunks_per_sec']:>8} chunks/s  "
+                  f"{case['tokens_per_sec']:>10} tokens/s  p50 {case['chunk_tokens'].get('p50')} tokens  "
+                  f"rss {case['peak_rss_mb']} MB")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.out}")
+    if args.compare:
+        compare(results, args.compare)
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
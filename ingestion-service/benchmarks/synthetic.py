@@ -0,0 +1,163 @@
+"""
+Synthetic insurance policies for ingestion benchmarks.
+
+Documents are built from a seeded generator (schedule tables, definitions,
+benefit tables and lists, exclusions, claims procedure) and rendered to PDF or
+DOCX with the standard library only, so benchmarks need no extra dependencies.
+"""
+import io
+import random
+import zipfile
+from xml.sax.saxutils import escape
+
+LINES_PER_PAGE = 60
+
+_WORDS = (
+    "policy insured person hospital accident illness treatment benefit limit excess "
+    "premium period cover claim payable reasonable medical expenses surgery emergency "
+    "waiting pre-existing condition vehicle damage liability third party theft fire "
+    "we will pay you must notify us within days of the event subject to terms conditions "
+    "the and of to for in any under this by with not be or an as"
+).split()
+
+
+def _sentence(rng, lo=8, hi=24):
+    words = rng.choices(_WORDS, k=rng.randint(lo, hi))
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph_lines(rng, sentences=4, width=95):
+    """Wrap a paragraph into visual lines the way a PDF would lay it out."""
+    text = " ".join(_sentence(rng) for _ in range(sentences))
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    return lines + [line]
+
+
+def _section(rng, n):
+    kind = n % 5
+    if kind == 0:
+        lines = ["POLICY SCHEDULE", ""]
+        lines += [f"Policy Number | POL-{rng.randint(100000, 999999)}",
+                  f"Policyholder | Customer {rng.randint(1, 9999)}",
+                  f"Period of Insurance | 2025-0{rng.randint(1, 9)}-01 to 2026-0{rng.randint(1, 9)}-01",
+                  f"Premium | {rng.randint(300, 3000)}.00"]
+        return lines + [""] + _paragraph_lines(rng, 2) + [""]
+    if kind == 1:
+        lines = [f"Section {n + 1} - Definitions", ""]
+        for _ in range(rng.randint(4, 8)):
+            lines += _paragraph_lines(rng, 1) + [""]
+        return lines
+    if kind == 2:
+        lines = ["What Is Covered", ""]
+        lines += [f"{b} | {rng.randint(1, 50) * 1000} | {rng.randint(0, 5) * 100}"
+                  for b in rng.sample(["Hospital", "Surgery", "Ambulance", "Dental", "Optical", "Theft", "Fire"], 4)]
+        lines += [""] + [f"- {_sentence(rng, 5, 12)}" for _ in range(rng.randint(3, 7))] + [""]
+        return lines
+    if kind == 3:
+        lines = [f"Section {n + 1} - Exclusions", ""]
+        lines += [f"{i + 1}. {_sentence(rng, 6, 14)}" for i in range(rng.randint(5, 10))]
+        return lines + [""]
+    lines = ["How To Make A Claim", ""]
+    for _ in range(rng.randint(2, 4)):
+        lines += _paragraph_lines(rng, 3) + [""]
+    return lines
+
+
+def policy_pages(pages: int, seed: int = 0):
+    """Return a list of pages, each a list of text lines."""
+    rng = random.Random(seed)
+    lines, n = [], 0
+    while len(lines) < pages * LINES_PER_PAGE:
+        lines += _section(rng, n)
+        n += 1
+    return [lines[i:i + LINES_PER_PAGE] for i in range(0, pages * LINES_PER_PAGE, LINES_PER_PAGE)]
+
+
+# --- PDF ---
+def _pdf_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def render_pdf(pages) -> bytes:
+    """Minimal PDF 1.4: one Helvetica text object per page, one Tj per line."""
+    objects = []  # (object number, body bytes)
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_num = 2 * len(pages) + 2  # after the font and a (content, page) pair per page
+    page_nums = []
+    for lines in pages:
+        ops = ["BT /F1 9 Tf 12 TL 40 800 Td"]
+        ops += [f"({_pdf_escape(line)}) Tj T*" for line in lines]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_nums.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_num, font, content)
+        ))
+    kids = " ".join(f"{p} 0 R" for p in page_nums).encode()
+    assert add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_nums))) == pages_num
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_num)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % i + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for off in offsets:
+        out.write(b"%010d 00000 n \n" % off)
+    out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref))
+    return out.getvalue()
+
+
+# --- DOCX ---
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+</Types>"""
+
+_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+
+def render_docx(pages) -> bytes:
+    """Minimal DOCX: one paragraph per line; table cells separated by tabs."""
+    paras = []
+    for lines in pages:
+        for line in lines:
+            cells = [escape(c.strip()) for c in line.split("|")]
+            runs = "<w:r><w:tab/></w:r>".join(f"<w:r><w:t xml:space=\"preserve\">{c}</w:t></w:r>" for c in cells)
+            paras.append(f"<w:p>{runs}</w:p>")
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{''.join(paras)}</w:body></w:document>"
+    )
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        z.writestr("_rels/.rels", _RELS)
+        z.writestr("word/document.xml", document)
+    return out.getvalue()
+
+
+def make_policy(fmt: str, pages: int, seed: int = 0) -> bytes:
+    content = policy_pages(pages, seed)
+    return render_pdf(content) if fmt == "pdf" else render_docx(content)
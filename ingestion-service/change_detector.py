@@ -0,0 +1,147 @@
+import json
+import time
+
+from config import S3_PAGE_SIZE, S3_FULL_SCAN_EVERY, S3_WATERMARK_SLACK, INGEST_SHARDS
+from leases import shard_of
+
+# Remove a pending entry only if it still describes the version we processed;
+# an overwrite that lands mid-processing keeps the newer entry queued.
+_RELEASE_PENDING = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+
+def _fingerprint(obj: dict) -> str:
+    return f"{obj['etag']}|{obj['last_modified']}"
+
+
+class S3ChangeDetector:
+    """
+    Durable, paginated change detection for an S3 prefix.
+
+    Redis layout (all under s3index:{bucket}:{prefix}):
+        :objects    hash  key -> "etag|last_modified" for every object seen
+        :watermark  hash  start_after (highest key seen), last_modified (newest object seen),
+                          full_scan_at (wall-clock start of the last completed full scan)
+        :pending:N  hash  key -> object json, discovered but not yet processed,
+                          sharded by key hash so replicas can work different shards
+
+    Incremental cycles list only keys after the StartAfter watermark. Every
+    S3_FULL_SCAN_EVERY cycles the whole prefix is paged through, but only objects
+    modified since the previous full scan started (less watermark_slack for clock
+    skew) are compared against the index.
+
+    A new key that sorts before the StartAfter watermark is only seen by a full
+    scan. The cutoff comes from when the previous full scan actually ran, not
+    from the configured cadence, so long drains or the scanner lease moving to
+    another replica cannot push such a key below it.
+    """
+
+    def __init__(self, s3_client, redis_client, bucket: str, prefix: str = "uploads/",
+                 page_size: int = S3_PAGE_SIZE, full_scan_every: int = S3_FULL_SCAN_EVERY,
+                 watermark_slack: int = S3_WATERMARK_SLACK, shards: int = INGEST_SHARDS):
+        self.s3 = s3_client
+        self.r = redis_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.page_size = page_size
+        self.full_scan_every = max(1, full_scan_every)
+        self.watermark_slack = watermark_slack
+        self.shards = max(1, shards)
+
+        ns = f"s3index:{bucket}:{prefix}"
+        self.objects_key = f"{ns}:objects"
+        self.watermark_key = f"{ns}:watermark"
+        self.pending_prefix = f"{ns}:pending"
+
+        self._release = self.r.register_script(_RELEASE_PENDING)
+        self._cycles = 0
+
+    # --- Listing ---
+    def _pages(self, start_after: str | None = None):
+        """Yield normalised object pages, following continuation tokens."""
+        params = {"Bucket": self.bucket, "Prefix": self.prefix,
+                  "PaginationConfig": {"PageSize": self.page_size}}
+        if start_after:
+            params["StartAfter"] = start_after
+
+        for page in self.s3.get_paginator("list_objects_v2").paginate(**params):
+            yield [
+                {
+                    "key": o["Key"],
+                    "etag": o["ETag"].strip('"'),
+                    "last_modified": o["LastModified"].timestamp(),
+                    "size": o.get("Size", 0),
+                }
+                for o in page.get("Contents", [])
+                if not o["Key"].endswith("/")  # folder placeholders
+            ]
+
+    def _watermark(self):
+        wm = self.r.hgetall(self.watermark_key)
+        return (wm.get("start_after") or None, float(wm.get("last_modified", 0)),
+                float(wm.get("full_scan_at", 0)))
+
+    # --- Detection ---
+    def scan(self) -> int:
+        """Run one detection cycle. Returns the number of new or changed objects queued."""
+        full = self._cycles % self.full_scan_every == 0
+        self._cycles += 1
+
+        started_at = time.time()
+        start_after, last_modified, full_scan_at = self._watermark()
+        # Anything older than the previous full scan's start was listed by it
+        cutoff = full_scan_at - self.watermark_slack if full and full_scan_at else None
+        new_start_after, new_last_modified = start_after, last_modified
+        queued = listed = 0
+
+        for page in self._pages(None if full else start_after):
+            listed += len(page)
+            if not page:
+                continue
+            new_start_after = max(new_start_after or "", page[-1]["key"])
+            new_last_modified = max(new_last_modified, max(o["last_modified"] for o in page))
+
+            candidates = page if cutoff is None else [o for o in page if o["last_modified"] > cutoff]
+            if not candidates:
+                continue
+
+            known = self.r.hmget(self.objects_key, [o["key"] for o in candidates])
+            changed = [o for o, fp in zip(candidates, known) if fp != _fingerprint(o)]
+            if not changed:
+                continue
+
+            pipe = self.r.pipeline(transaction=False)
+            for o in changed:
+                pipe.hset(self._pending_key(o["key"]), o["key"], json.dumps(o))
+            pipe.hset(self.objects_key, mapping={o["key"]: _fingerprint(o) for o in changed})
+            pipe.execute()
+            queued += len(changed)
+
+        watermark = {"start_after": new_start_after, "last_modified": new_last_modified} if new_start_after else {}
+        if full:
+            # Only recorded once the listing completed; a failed scan keeps the older cutoff
+            watermark["full_scan_at"] = started_at
+        if watermark:
+            self.r.hset(self.watermark_key, mapping=watermark)
+
+        print(f"🔎 {'Full' if full else 'Incremental'} scan of {self.prefix}: "
+              f"listed {listed}, queued {queued}")
+        return queued
+
+    # --- Pending work ---
+    def _pending_key(self, key: str) -> str:
+        return f"{self.pending_prefix}:{shard_of(key, self.shards)}"
+
+    def pending(self, shard: int) -> list[dict]:
+        return [json.loads(v) for v in self.r.hvals(f"{self.pending_prefix}:{shard}")]
+
+    def is_pending(self, obj: dict) -> bool:
+        """True while this exact version of the object is still queued."""
+        return self.r.hget(self._pending_key(obj["key"]), obj["key"]) == json.dumps(obj)
+
+    def mark_done(self, obj: dict) -> bool:
+        return bool(self._release(keys=[self._pending_key(obj["key"])], args=[obj["key"], json.dumps(obj)]))
@@ -0,0 +1,316 @@
+import re
+from bisect import bisect_left, bisect_right
+
+from config import MAX_TOKENS, OVERLAP
+
+BLOCK_SEP = "\n\n"
+
+# --- Section Detection ---
+# Checked in order; the first match names the section a heading opens.
+SECTION_PATTERNS = [
+    ("SCHEDULE", re.compile(r"\bschedule\b|certificate of insurance|policy details")),
+    ("DEFINITIONS", re.compile(r"\bdefinitions?\b|meaning of (certain )?words|glossary")),
+    ("EXCLUSIONS", re.compile(r"\bexclusions?\b|\bexceptions\b|not covered|will not (pay|cover)")),
+    ("CLAIMS", re.compile(r"\bclaims?\b")),
+    ("BENEFITS", re.compile(r"\bbenefits?\b|\bcover(age|ed)?\b|what (is|we) cover")),
+]
+_BULLET = re.compile(r"^(\*|-|•)\s+")
+_HEADING_PREFIX = re.compile(r"^((section|part|chapter)\s+[\w.]+|\d{1,2}(\.\d{1,2})*\.?|[A-Z][.)])\s*[:.)\-–]?\s+", re.I)
+
+
+def heading_section(line: str, standalone: bool = True):
+    """
+    Return the section a heading line opens, or None if the line is not a
+    section heading. Headings are short, unpunctuated, capitalised lines
+    without digits (which rules out "POLICY NUMBER: 123"-style schedule labels).
+    Upper-case or numbered headings count anywhere; a Title Case line only when
+    standalone (after a blank line), since wrapped body text such as
+    "Schedule of Benefits" or "Claims will be paid" looks the same mid-paragraph.
+    A structural heading ("SECTION 4 GENERAL CONDITIONS") with no known keyword
+    resets to GENERAL.
+    """
+    if not line or len(line) > 80 or line[-1] in ".,;" or _BULLET.match(line):
+        return None
+
+    prefix = _HEADING_PREFIX.match(line)
+    body = line[prefix.end():] if prefix else line
+    body = body.strip(" :-–")
+    words = body.split()
+    if not words or len(words) > 8 or any(c.isdigit() for c in body) or ": " in body:
+        return None
+
+    upper = body.isupper()
+    titled = all(w[0].isupper() or len(w) <= 3 for w in words if w[0].isalpha())
+    if not (upper or (titled and (prefix or standalone))):
+        return None
+
+    low = body.lower()
+    for section, pattern in SECTION_PATTERNS:
+        if pattern.search(low):
+            return section
+    return "GENERAL" if upper and prefix else None
+
+
+# --- Block Detection ---
+def detect_blocks(text: str):
+    """
+    Split into semantic blocks tagged with the policy section they fall under.
+    A heading that opens a new section also starts a new block. Blocks keep
+    their source line range.
+    """
+    lines = text.split("\n")
+    blocks, buffer, buffer_start = [], [], 0
+    section = "GENERAL"
+
+    def flush(line_end):
+        nonlocal buffer
+        if buffer:
+            blocks.append({"text": "\n".join(buffer).strip(), "section": section,
+                           "line_start": buffer_start, "line_end": line_end})
+            buffer = []
+
+    for n, line in enumerate(lines):
+        line_strip = line.strip()
+
+        if "|" in line_strip or "\t" in line_strip:
+            flush(n - 1)
+            blocks.append({"text": f"[TABLE START]\n{line_strip}\n[TABLE END]", "section": section,
+                           "line_start": n, "line_end": n})
+            continue
+
+        # An empty buffer means the previous line was blank (or a table row)
+        heading = heading_section(line_strip, standalone=not buffer)
+        if heading and heading != section:
+            flush(n - 1)
+            section = heading
+
+        if not buffer:
+            buffer_start = n
+
+        if re.match(r"^(\*|-|•)\s+", line_strip) or re.match(r"^\d+\.\s+", line_strip):
+            buffer.append("[LIST ITEM] " + line_strip)
+            continue
+
+        if line_strip == "":
+            flush(n - 1)
+        else:
+            buffer.append(line_strip)
+
+    flush(len(lines) - 1)
+    return blocks
+
+
+# --- Legacy chunker (per-block encode/decode) ---
+def legacy_chunk(text: str, tokenizer, max_tokens=MAX_TOKENS, overlap=OVERLAP):
+    """Original chunker, kept as the reference for parity checks and slow tokenizers."""
+
+    def tokenize_length(t: str) -> int:
+        return len(tokenizer.encode(t, add_special_tokens=False))
+
+    blocks = detect_blocks(text)
+    raw_chunks, buffer, buffer_tokens = [], [], 0
+
+    for block in blocks:
+        block_text = block["text"]
+        tokens = tokenizer.encode(block_text, add_special_tokens=False)
+
+        if len(tokens) > max_tokens:
+            words, sub_chunk, sub_tokens = block_text.split(), [], 0
+            for word in words:
+                word_tokens = tokenize_length(word)
+                if sub_tokens + word_tokens > max_tokens:
+                    raw_chunks.append({"text": " ".join(sub_chunk)})
+                    sub_chunk, sub_tokens = [word], word_tokens
+                else:
+                    sub_chunk.append(word)
+                    sub_tokens += word_tokens
+            if sub_chunk:
+                raw_chunks.append({"text": " ".join(sub_chunk)})
+            continue
+
+        if buffer_tokens + len(tokens) <= max_tokens:
+            buffer.append(block_text)
+            buffer_tokens += len(tokens)
+        else:
+            raw_chunks.append({"text": "\n\n".join(buffer)})
+            buffer, buffer_tokens = [block_text], len(tokens)
+
+    if buffer:
+        raw_chunks.append({"text": "\n\n".join(buffer)})
+
+    final_chunks = []
+    for i, chunk in enumerate(raw_chunks):
+        tokens = tokenizer.encode(chunk["text"], add_special_tokens=False)
+        if len(tokens) > max_tokens:
+            tokens = tokens[:max_tokens]
+
+        if overlap > 0 and i > 0:
+            prev_tokens = tokenizer.encode(final_chunks[-1]["text"], add_special_tokens=False)
+            overlap_tokens = prev_tokens[-overlap:]
+            tokens = overlap_tokens + tokens
+            tokens = tokens[:max_tokens]
+
+        final_chunks.append({"text": tokenizer.decode(tokens)})
+
+    return final_chunks
+
+
+# --- Offset-mapped chunker (single tokenizer pass) ---
+def _is_word_start(offsets, i: int) -> bool:
+    return i == 0 or offsets[i][0] > offsets[i - 1][1]
+
+
+def _split_oversized(offsets, start: int, end: int, budget: int):
+    """Greedy word-aligned split of one block's token range, as legacy does with str.split()."""
+    spans, cut = [], start
+    words = [start] + [i for i in range(start + 1, end) if _is_word_start(offsets, i)] + [end]
+    for a, b in zip(words, words[1:]):
+        if b - cut > budget:
+            if a > cut:
+                spans.append((cut, a))
+                cut = a
+            while b - cut > budget:  # a single word longer than the budget
+                spans.append((cut, cut + budget))
+                cut += budget
+    if cut < end:
+        spans.append((cut, end))
+    return spans
+
+
+def offset_chunk(text: str, tokenizer, max_tokens=MAX_TOKENS, overlap=OVERLAP, sections=True):
+    """
+    Chunk with one fast-tokenizer pass over the whole document.
+
+    Blocks from detect_blocks are joined, tokenized once with return_offsets_mapping,
+    and packed by token counts. Chunks and overlaps are cut as character spans of the
+    joined text, so nothing is re-encoded or decoded and the original casing and
+    spacing survive. Chunks are packed to (max_tokens - overlap) so the overlap
+    prefix never pushes a chunk past max_tokens.
+
+    With sections on, chunks never straddle a section boundary, overlaps are not
+    carried across one, and each chunk is tagged with its section.
+    """
+    blocks = detect_blocks(text)
+    if not blocks:
+        return []
+
+    doc = BLOCK_SEP.join(b["text"] for b in blocks)
+    offsets = tokenizer(
+        doc,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        return_attention_mask=False,
+        return_token_type_ids=False,
+        verbose=False,
+    )["offset_mapping"]
+    if not offsets:
+        return []
+    starts = [s for s, _ in offsets]
+
+    # Block char spans -> token ranges
+    ranges, pos = [], 0
+    for b in blocks:
+        end = pos + len(b["text"])
+        ranges.append((bisect_left(starts, pos), bisect_left(starts, end)))
+        pos = end + len(BLOCK_SEP)
+
+    overlap = max(0, min(overlap, max_tokens - 1))
+    budget = max_tokens - overlap
+
+    # Pack block token ranges into contiguous raw spans, in document order
+    spans, cur_start, cur_end, cur_section = [], None, None, None
+    for block, (ts, te) in zip(blocks, ranges):
+        if te <= ts:
+            continue
+        if sections and cur_start is not None and block["section"] != cur_section:
+            spans.append((cur_start, cur_end))
+            cur_start = None
+        cur_section = block["section"]
+        if te - ts > budget:
+            if cur_start is not None:
+                spans.append((cur_start, cur_end))
+                cur_start = None
+            spans.extend(_split_oversized(offsets, ts, te, budget))
+            continue
+        if cur_start is not None and te - cur_start <= budget:
+            cur_end = te
+        else:
+            if cur_start is not None:
+                spans.append((cur_start, cur_end))
+            cur_start, cur_end = ts, te
+    if cur_start is not None:
+        spans.append((cur_start, cur_end))
+
+    block_starts = [ts for ts, _ in ranges]
+
+    def block_of(token):
+        return blocks[bisect_right(block_starts, token) - 1]
+
+    chunks = []
+    for i, (s, e) in enumerate(spans):
+        section = block_of(s)["section"]
+        if overlap and i > 0 and (not sections or block_of(s - 1)["section"] == section):
+            # Start the overlap on a word boundary inside the previous chunk's tail
+            lo = max(spans[i - 1][0], s - overlap)
+            s = next((w for w in range(lo, s) if _is_word_start(offsets, w)), lo)
+        chunks.append({
+            "text": doc[offsets[s][0]:offsets[e - 1][1]],
+            "token_count": e - s,
+            "section": section,
+            "line_start": block_of(s)["line_start"],
+            "line_end": block_of(e - 1)["line_end"],
+        })
+    return chunks
+
+
+# --- Parity check ---
+def check_parity(text: str, tokenizer, max_tokens=MAX_TOKENS):
+    """
+    Compare offset_chunk against legacy_chunk on the same text (overlap disabled,
+    since the two place overlaps differently by design).
+
+    Chunks are compared as token-id sequences. Legacy emits an oversized block's
+    pieces ahead of still-buffered earlier blocks, so when a block is oversized
+    chunk-by-chunk comparison is impossible ("stream" mode). Then offset_chunk's
+    concatenated chunks must equal the document's block token stream in order,
+    and legacy must cover the same tokens (in its own order).
+    """
+    def ids(chunks):
+        return [tuple(tokenizer.encode(c["text"], add_special_tokens=False)) for c in chunks]
+
+    legacy = [c for c in ids(legacy_chunk(text, tokenizer, max_tokens, 0)) if c]
+    offset = ids(offset_chunk(text, tokenizer, max_tokens, 0, sections=False))
+
+    blocks = detect_blocks(text)
+    oversized = any(len(tokenizer.encode(b["text"], add_special_tokens=False)) > max_tokens for b in blocks)
+    flat = lambda seqs: [t for s in seqs for t in s]
+
+    if oversized:
+        stream = tokenizer.encode(BLOCK_SEP.join(b["text"] for b in blocks), add_special_tokens=False)
+        ok = flat(offset) == stream and sorted(flat(legacy)) == sorted(stream)
+    else:
+        ok = legacy == offset
+
+    return {
+        "legacy_chunks": len(legacy),
+        "offset_chunks": len(offset),
+        "exact_matches": sum(1 for a, b in zip(legacy, offset) if a == b),
+        "max_chunk_tokens": max((len(c) for c in offset), default=0),
+        "mode": "stream" if oversized else "exact",
+        "ok": ok,
+    }
+
+
+if __name__ == "__main__":
+    import json
+    import os
+    import sys
+    from transformers import AutoTokenizer
+
+    tok = AutoTokenizer.from_pretrained(os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2"))
+    report = {}
+    for path in sys.argv[1:]:
+        with open(path, encoding="utf-8") as f:
+            report[path] = check_parity(f.read(), tok)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if all(r["ok"] for r in report.values()) else 1)
@@ -0,0 +1,65 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- S3 change detection ---
+S3_PREFIX = os.getenv("S3_PREFIX", "uploads/")
+S3_POLL_INTERVAL = int(os.getenv("S3_POLL_INTERVAL", 30))
+S3_PAGE_SIZE = int(os.getenv("S3_PAGE_SIZE", 1000))
+# Every Nth cycle lists the whole prefix instead of only keys after the StartAfter
+# watermark, so overwrites and keys that sort before the watermark are still seen.
+# Upload keys are not time-ordered (uploads/<filename>), so a new file that sorts
+# before the watermark waits for the next full scan: pickup latency is roughly
+# S3_FULL_SCAN_EVERY * S3_POLL_INTERVAL seconds plus drain time. Lower N means
+# faster pickup but more full listings.
+S3_FULL_SCAN_EVERY = int(os.getenv("S3_FULL_SCAN_EVERY", 5))
+# Full scans skip objects last modified before the previous full scan started,
+# minus this margin for clock skew between this host and S3.
+S3_WATERMARK_SLACK = int(os.getenv("S3_WATERMARK_SLACK", 300))
+
+# --- Chunking ---
+MAX_TOKENS = int(os.getenv("MAX_TOKENS", 450))
+MIN_TOKENS = int(os.getenv("MIN_TOKENS", 20))
+OVERLAP = int(os.getenv("OVERLAP", 60))
+# "offset" tokenizes each document once and cuts chunks as character spans;
+# "legacy" keeps the original per-block encode/decode chunker.
+CHUNKER = os.getenv("CHUNKER", "offset")
+
+# --- PDF extraction ---
+# Worker processes for page-parallel PDF extraction (1 disables the pool).
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", min(4, os.cpu_count() or 1)))
+# Documents with fewer pages than this are extracted serially in-process.
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 16))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 8))
+
+# --- Object download ---
+# Objects up to this size are extracted straight from memory; larger ones spill
+# to a unique temp file.
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", 32 * 1024 * 1024))
+STREAM_CHUNK_BYTES = int(os.getenv("STREAM_CHUNK_BYTES", 1024 * 1024))
+
+# --- Publishing ---
+# "batch" groups a document's chunks into envelopes; "single" sends one message per chunk.
+PUBLISH_MODE = os.getenv("PUBLISH_MODE", "batch")
+PUBLISH_BATCH_MAX_CHUNKS = int(os.getenv("PUBLISH_BATCH_MAX_CHUNKS", 64))
+PUBLISH_BATCH_MAX_BYTES = int(os.getenv("PUBLISH_BATCH_MAX_BYTES", 512 * 1024))
+PUBLISH_CONFIRMS = os.getenv("PUBLISH_CONFIRMS", "true").lower() == "true"
+PUBLISH_RETRIES = int(os.getenv("PUBLISH_RETRIES", 3))
+# Envelopes published ahead of their broker confirms (the outstanding-confirm window).
+PUBLISH_CONFIRM_WINDOW = int(os.getenv("PUBLISH_CONFIRM_WINDOW", 8))
+
+# --- Incremental re-ingestion ---
+# Re-uploads only publish chunks whose fingerprint is not in the key's manifest.
+INCREMENTAL_INGEST = os.getenv("INCREMENTAL_INGEST", "true").lower() == "true"
+
+# --- Scale-out ---
+# Identity of this replica in lease ownership; defaults to hostname:pid.
+INGEST_WORKER_ID = os.getenv("INGEST_WORKER_ID", "")
+# Pending objects are spread over this many shards by key hash.
+INGEST_SHARDS = int(os.getenv("INGEST_SHARDS", 16))
+# Leases expire this long after their last heartbeat, so a crashed replica's
+# work is picked up by another one. Keep it above S3_POLL_INTERVAL: the scanner
+# lease is only heartbeated while a cycle runs, not during the sleep between cycles.
+LEASE_TTL = int(os.getenv("LEASE_TTL", 120))
+INGEST_AUTOSTART = os.getenv("INGEST_AUTOSTART", "true").lower() == "true"
@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import tempfile
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import docx2txt
+import pdfplumber
+
+from config import PDF_WORKERS, PDF_PARALLEL_MIN_PAGES, PDF_PAGES_PER_TASK
+
+_pool = None
+
+
+def _get_pool():
+    """Lazily start the shared extraction pool (spawned, so no inherited threads or sockets)."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        print(f"🧵 Started PDF extraction pool with {PDF_WORKERS} workers")
+    return _pool
+
+
+def _extract_page_range(path: str, start: int, end: int):
+    """Pool task: extract pages [start, end) of the PDF at path."""
+    with pdfplumber.open(path) as pdf:
+        return [(i + 1, pdf.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def extract_pdf_pages(source):
+    """
+    Extract a PDF (path or binary file object) page by page.
+
+    Small documents (or PDF_WORKERS <= 1) are handled serially; larger ones are
+    split into PDF_PAGES_PER_TASK page ranges and fanned out to the process pool.
+    Tasks get a file path, never the document bytes: an in-memory buffer is
+    written to a temp file once, rather than pickled into every task.
+    Results come back in page order either way.
+    """
+    with pdfplumber.open(source) as pdf:
+        page_count = len(pdf.pages)
+        if PDF_WORKERS <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+            return [{"page": i + 1, "text": page.extract_text() or ""} for i, page in enumerate(pdf.pages)]
+
+    if isinstance(source, str):
+        return _extract_parallel(source, page_count)
+
+    fd, path = tempfile.mkstemp(prefix="ingest-", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(source.getbuffer())
+        return _extract_parallel(path, page_count)
+    finally:
+        os.remove(path)
+
+
+def _extract_parallel(path: str, page_count: int):
+    global _pool
+    ranges = [(a, min(a + PDF_PAGES_PER_TASK, page_count)) for a in range(0, page_count, PDF_PAGES_PER_TASK)]
+    try:
+        futures = [_get_pool().submit(_extract_page_range, path, a, b) for a, b in ranges]
+        results = [page for f in futures for page in f.result()]
+    except BrokenProcessPool:
+        print("⚠️ PDF extraction pool died, retrying serially")
+        _pool = None
+        results = [page for a, b in ranges for page in _extract_page_range(path, a, b)]
+
+    print(f"📄 Extracted {page_count} pages in {len(ranges)} parallel tasks")
+    return [{"page": n, "text": text} for n, text in results]
+
+
+def extract_pages(source, filename: str):
+    """
+    Return [{"page": n, "text": ...}] for a PDF, or a single page-less entry for DOCX.
+    source is a path or binary file object; filename decides the format.
+    """
+    if filename.endswith(".pdf"):
+        return extract_pdf_pages(source)
+    elif filename.endswith(".docx"):
+        return [{"page": None, "text": docx2txt.process(source)}]
+    else:
+        raise ValueError("Unsupported file type")
+
+
+def join_pages(pages) -> str:
+    return "\n".join(p["text"] for p in pages)
+
+
+def assign_pages(chunks, pages):
+    """Set page_start/page_end on chunks that carry line_start/line_end (see chunker)."""
+    line_starts, line = [], 0
+    for p in pages:
+        line_starts.append(line)
+        line += p["text"].count("\n") + 1
+
+    def page_of(line_no):
+        return pages[bisect_right(line_starts, line_no) - 1]["page"]
+
+    for chunk in chunks:
+        if "line_start" in chunk:
+            chunk["page_start"] = page_of(chunk["line_start"])
+            chunk["page_end"] = page_of(chunk["line_end"])
+    return chunks
@@ -0,0 +1,98 @@
+import threading
+import uuid
+import zlib
+from contextlib import contextmanager
+
+from config import LEASE_TTL
+
+# Take the lease if free, or extend it if we already hold it.
+_ACQUIRE = """
+local owner = redis.call('GET', KEYS[1])
+if not owner then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+elseif owner == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaseLost(Exception):
+    """The lease expired or was taken over while its work was still running."""
+
+
+def shard_of(key: str, shards: int) -> int:
+    return zlib.crc32(key.encode("utf-8")) % shards
+
+
+class Lease:
+    """
+    A Redis lease on one unit of work (ingest:lease:{name}).
+
+    Ownership is a per-lease token, so only the holder can renew or release it.
+    A lease that is not renewed within ttl seconds expires and can be claimed
+    by another replica.
+    """
+
+    def __init__(self, redis_client, name: str, owner: str, ttl: int = LEASE_TTL):
+        self.r = redis_client
+        self.key = f"ingest:lease:{name}"
+        self.token = f"{owner}:{uuid.uuid4().hex[:8]}"
+        self.ttl_ms = ttl * 1000
+        self._acquire = self.r.register_script(_ACQUIRE)
+        self._release = self.r.register_script(_RELEASE)
+        self.lost = False
+
+    def acquire(self) -> bool:
+        return bool(self._acquire(keys=[self.key], args=[self.token, self.ttl_ms]))
+
+    renew = acquire
+
+    def held(self) -> bool:
+        """Renew and report whether we still own the lease; once lost it stays lost."""
+        if not self.lost and not self.renew():
+            self.lost = True
+        return not self.lost
+
+    def check(self):
+        """Raise LeaseLost unless we still own the lease. Call before side effects."""
+        if not self.held():
+            raise LeaseLost(self.key)
+
+    def release(self):
+        self._release(keys=[self.key], args=[self.token])
+
+    @contextmanager
+    def heartbeat(self, release: bool = True):
+        """
+        Keep renewing the lease from a background thread while the block runs.
+        A failed renewal sets self.lost; the block should call check() before
+        anything another holder could conflict with.
+        """
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.ttl_ms / 3000):
+                if not self.renew():
+                    self.lost = True
+                    print(f"⚠️ Lost lease {self.key}")
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+            if release:
+                self.release()
@@ -0,0 +1,32 @@
+import hashlib
+
+
+def chunk_ids(key: str, chunks: list) -> list:
+    """
+    Content-derived Chroma ids: {key}__{sha256(section + text)[:16]}, with a
+    suffix for repeated identical chunks. An unchanged chunk keeps its id wherever
+    it moves; a chunk whose section changes gets a new one.
+    """
+    ids, seen = [], {}
+    for chunk in chunks:
+        content = f"{chunk.get('section', 'GENERAL')}\0{chunk['text']}"
+        fp = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+        n = seen.get(fp, 0)
+        seen[fp] = n + 1
+        ids.append(f"{key}__{fp}" if n == 0 else f"{key}__{fp}_{n}")
+    return ids
+
+
+class ChunkManifest:
+    """
+    Per-key record of the chunk ids stored in Chroma, as Redis hash manifest:{key}
+    (id -> position). Written by the embedding worker's sync_document after the
+    document's chunks are persisted, never at publish time, so an id only appears
+    here once its vector exists.
+    """
+
+    def __init__(self, redis_client):
+        self.r = redis_client
+
+    def load(self, key: str) -> dict:
+        return self.r.hgetall(f"manifest:{key}")
@@ -0,0 +1,41 @@
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+
+from config import SPOOL_MAX_BYTES, STREAM_CHUNK_BYTES
+
+
+@contextmanager
+def open_object(s3_client, bucket: str, key: str, spool_max: int = SPOOL_MAX_BYTES):
+    """
+    Stream an S3 object into something the extractors can read.
+
+    Yields an in-memory BytesIO when the object is at most spool_max bytes,
+    otherwise the path of a uniquely named temp file. Either way the buffer is
+    released when the block exits, including on errors.
+    """
+    resp = s3_client.get_object(Bucket=bucket, Key=key)
+    body = resp["Body"]
+    size = resp.get("ContentLength", 0)
+    tmp_path = None
+
+    try:
+        if size <= spool_max:
+            buf = io.BytesIO()
+            for chunk in body.iter_chunks(STREAM_CHUNK_BYTES):
+                buf.write(chunk)
+            buf.seek(0)
+            with buf:
+                yield buf
+        else:
+            fd, tmp_path = tempfile.mkstemp(prefix="ingest-", suffix=os.path.splitext(key)[1])
+            with os.fdopen(fd, "wb") as f:
+                for chunk in body.iter_chunks(STREAM_CHUNK_BYTES):
+                    f.write(chunk)
+            print(f"💾 Spooled {key} ({size} bytes) to {tmp_path}")
+            yield tmp_path
+    finally:
+        body.close()
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import threading
+import time
+
+import aio_pika
+from aio_pika.exceptions import AMQPError, ChannelInvalidStateError, DeliveryError, PublishError
+
+from config import (
+    PUBLISH_MODE, PUBLISH_BATCH_MAX_CHUNKS, PUBLISH_BATCH_MAX_BYTES,
+    PUBLISH_CONFIRMS, PUBLISH_RETRIES, PUBLISH_CONFIRM_WINDOW,
+)
+
+
+class ChunkPublisher:
+    """
+    Publish a document's chunks to RabbitMQ.
+
+    In "batch" mode chunks are grouped into envelopes of at most max_chunks chunks
+    and max_bytes of JSON:
+
+        {"type": "batch", "chunks": [<chunk payload>, ...]}
+
+    Each chunk is serialised once and spliced into its envelope. With confirms on,
+    up to `window` envelopes are published ahead of their broker confirms, and
+    publish() returns once every one of them is confirmed. Nacked, unroutable or
+    dropped publishes are retried on a fresh channel and, past the retry limit,
+    raised to the caller so the object stays pending.
+
+    Publishing runs on aio-pika in a private event loop thread, so callers stay
+    synchronous.
+    """
+
+    def __init__(self, connect, queue: str, mode: str = PUBLISH_MODE,
+                 max_chunks: int = PUBLISH_BATCH_MAX_CHUNKS, max_bytes: int = PUBLISH_BATCH_MAX_BYTES,
+                 confirms: bool = PUBLISH_CONFIRMS, retries: int = PUBLISH_RETRIES,
+                 window: int = PUBLISH_CONFIRM_WINDOW):
+        self._connect = connect  # async () -> aio-pika connection
+        self.queue = queue
+        self.mode = mode
+        self.max_chunks = max(1, max_chunks)
+        self.max_bytes = max_bytes
+        self.confirms = confirms
+        self.retries = retries
+        self.window = max(1, window)
+        self.connection = None
+        self.channel = None
+        self.stats = {
+            "documents": 0, "chunks": 0, "messages": 0, "bytes": 0, "retries": 0,
+            "publish_seconds": 0.0, "confirm_ms_max": 0.0,
+        }
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._channel_lock = None  # created on the loop
+
+    # --- Channel ---
+    async def _channel(self):
+        if self._channel_lock is None:
+            self._channel_lock = asyncio.Lock()
+        async with self._channel_lock:  # envelopes in flight share one channel
+            if self.channel is None or self.channel.is_closed:
+                await self._reset(self.channel)
+                self.connection = await self._connect()
+                # on_return_raises turns an unroutable mandatory publish into an error
+                self.channel = await self.connection.channel(
+                    publisher_confirms=self.confirms, on_return_raises=self.confirms,
+                )
+                await self.channel.declare_queue(self.queue, durable=True)
+            return self.channel
+
+    async def _reset(self, channel):
+        if self.channel is not channel:
+            return  # another envelope already replaced it
+        connection, self.connection, self.channel = self.connection, None, None
+        try:
+            if connection is not None:
+                await connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Close the channel and stop the publishing loop."""
+        if self.channel is not None:
+            asyncio.run_coroutine_threadsafe(self._reset(self.channel), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    # --- Envelopes ---
+    def _envelopes(self, payloads):
+        """Yield (body, chunk_count) for each message to send."""
+        if self.mode != "batch":
+            for p in payloads:
+                yield json.dumps(p), 1
+            return
+
+        parts, size = [], 0
+        for p in payloads:
+            part = json.dumps(p)
+            if parts and (len(parts) >= self.max_chunks or size + len(part) > self.max_bytes):
+                yield self._wrap(parts), len(parts)
+                parts, size = [], 0
+            parts.append(part)
+            size += len(part) + 2
+        if parts:
+            yield self._wrap(parts), len(parts)
+
+    @staticmethod
+    def _wrap(parts):
+        return '{"type": "batch", "chunks": [' + ", ".join(parts) + "]}"
+
+    # --- Publishing ---
+    async def _send(self, body: str) -> float:
+        """Publish one message, returning its publish/confirm latency in seconds."""
+        err = None
+        for attempt in range(self.retries + 1):
+            channel = None
+            try:
+                start = time.perf_counter()
+                channel = await self._channel()
+                await channel.default_exchange.publish(
+                    aio_pika.Message(body.encode("utf-8"), delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+                    routing_key=self.queue,
+                    mandatory=self.confirms,
+                )
+                return time.perf_counter() - start
+            except (DeliveryError, PublishError) as e:  # nacked or returned unroutable
+                err = e
+            except (AMQPError, ChannelInvalidStateError, ConnectionError, OSError) as e:
+                err = e
+                if channel is not None:
+                    await self._reset(channel)
+            self.stats["retries"] += 1
+            print(f"⚠️ Publish attempt {attempt + 1}/{self.retries + 1} failed: {err!r}")
+            await asyncio.sleep(min(2 ** attempt, 10))
+        raise RuntimeError(f"Could not publish to {self.queue}: {err!r}")
+
+    async def _send_all(self, bodies: list) -> list:
+        """Send every body with at most self.window unconfirmed at once."""
+        slots = asyncio.Semaphore(self.window)
+
+        async def send(body):
+            async with slots:
+                return await self._send(body)
+
+        results = await asyncio.gather(*(send(b) for b in bodies), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise errors[0]
+        return results
+
+    def publish(self, payloads: list) -> dict:
+        """
+        Publish payloads and return throughput/latency figures. Returns once every
+        message is confirmed, so items published by a later call (a document's
+        sync) always follow these.
+        """
+        start = time.perf_counter()
+        bodies = [body for body, _ in self._envelopes(payloads)]
+        latencies = asyncio.run_coroutine_threadsafe(self._send_all(bodies), self._loop).result()
+        messages, sent_bytes = len(bodies), sum(len(b) for b in bodies)
+
+        chunks = sum(1 for p in payloads if p.get("type") != "sync")
+        elapsed = time.perf_counter() - start
+        report = {
+            "chunks": chunks,
+            "messages": messages,
+            "bytes": sent_bytes,
+            "seconds": round(elapsed, 4),
+            "messages_per_sec": round(messages / elapsed, 1) if elapsed else None,
+            "chunks_per_sec": round(chunks / elapsed, 1) if elapsed else None,
+            "confirm_ms_avg": round(1000 * sum(latencies) / len(latencies), 2) if latencies else None,
+            "confirm_ms_max": round(1000 * max(latencies), 2) if latencies else None,
+        }
+
+        # A sync closes out a document
+        self.stats["documents"] += len(payloads) - chunks
+        self.stats["chunks"] += chunks
+        self.stats["messages"] += messages
+        self.stats["bytes"] += sent_bytes
+        self.stats["publish_seconds"] += elapsed
+        self.stats["confirm_ms_max"] = max(self.stats["confirm_ms_max"], report["confirm_ms_max"] or 0.0)
+
+        if chunks:
+            print(f"📤 Published {chunks} chunks in {messages} messages: "
+                  f"{report['messages_per_sec']} msg/s, confirm avg {report['confirm_ms_avg']} ms, "
+                  f"max {report['confirm_ms_max']} ms")
+        return report
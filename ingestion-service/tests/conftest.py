@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Service modules are flat top-level files; make them importable from tests/.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from benchmarks.synthetic import policy_pages
+from chunker import BLOCK_SEP, check_parity, detect_blocks, heading_section, legacy_chunk, offset_chunk
+
+MODEL_NAME = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+
+@pytest.mark.parametrize("line,standalone,section", [
+    ("Cover for personal belongings is", False, None),
+    ("Claims will be paid", False, None),
+    ("Schedule of Benefits", False, None),
+    ("Schedule of Benefits", True, "SCHEDULE"),
+    ("What is not covered", True, None),
+    ("WHAT IS NOT COVERED", False, "EXCLUSIONS"),
+    ("3. Claims Procedure", False, "CLAIMS"),
+    ("POLICY NUMBER: 123", True, None),
+])
+def test_heading_section(line, standalone, section):
+    assert heading_section(line, standalone=standalone) == section
+
+
+def test_wrapped_body_line_keeps_section():
+    text = "Your belongings\nCover for personal belongings is\nlimited to the sum insured.\n\nClaims Procedure\nCall us."
+    assert [b["section"] for b in detect_blocks(text)] == ["GENERAL", "CLAIMS"]
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    transformers = pytest.importorskip("transformers")
+    try:
+        tok = transformers.AutoTokenizer.from_pretrained(MODEL_NAME)
+    except Exception as e:
+        pytest.skip(f"tokenizer {MODEL_NAME} unavailable: {e}")
+    if not tok.is_fast:
+        pytest.skip("offset_chunk needs a fast tokenizer")
+    return tok
+
+
+def document(pages: int, seed: int) -> str:
+    return "\n".join("\n".join(lines) for lines in policy_pages(pages, seed))
+
+
+def chunk_ids(chunks, tokenizer):
+    return [tokenizer.encode(c["text"], add_special_tokens=False) for c in chunks]
+
+
+def block_stream(text, tokenizer):
+    blocks = detect_blocks(text)
+    return tokenizer.encode(BLOCK_SEP.join(b["text"] for b in blocks), add_special_tokens=False)
+
+
+def largest_block(text, tokenizer):
+    return max(len(tokenizer.encode(b["text"], add_special_tokens=False)) for b in detect_blocks(text))
+
+
+@pytest.mark.parametrize("pages,seed", [(3, 0), (10, 1), (30, 2)])
+def test_exact_parity_without_oversized_blocks(tokenizer, pages, seed):
+    text = document(pages, seed)
+    max_tokens = max(450, largest_block(text, tokenizer))
+
+    legacy = [c for c in chunk_ids(legacy_chunk(text, tokenizer, max_tokens, 0), tokenizer) if c]
+    offset = chunk_ids(offset_chunk(text, tokenizer, max_tokens, 0, sections=False), tokenizer)
+
+    assert offset == legacy
+    assert check_parity(text, tokenizer, max_tokens) == {
+        "legacy_chunks": len(legacy),
+        "offset_chunks": len(offset),
+        "exact_matches": len(offset),
+        "max_chunk_tokens": max(len(c) for c in offset),
+        "mode": "exact",
+        "ok": True,
+    }
+
+
+@pytest.mark.parametrize("max_tokens", [32, 64])
+@pytest.mark.parametrize("pages,seed", [(3, 0), (10, 1)])
+def test_stream_parity_with_oversized_blocks(tokenizer, pages, seed, max_tokens):
+    text = document(pages, seed)
+    assert largest_block(text, tokenizer) > max_tokens
+
+    stream = block_stream(text, tokenizer)
+    offset = chunk_ids(offset_chunk(text, tokenizer, max_tokens, 0, sections=False), tokenizer)
+    legacy = chunk_ids(legacy_chunk(text, tokenizer, max_tokens, 0), tokenizer)
+
+    # offset_chunk must keep document order; a reordered chunk breaks this.
+    assert [t for c in offset for t in c] == stream
+    assert all(len(c) <= max_tokens for c in offset)
+    assert sorted(t for c in legacy for t in c) == sorted(stream)
+
+    report = check_parity(text, tokenizer, max_tokens)
+    assert report["mode"] == "stream"
+    assert report["ok"]
+
+
+def test_stream_parity_rejects_reordered_chunks(tokenizer, monkeypatch):
+    import chunker
+
+    text = document(3, 0)
+    real = chunker.offset_chunk
+    monkeypatch.setattr(chunker, "offset_chunk", lambda *a, **kw: real(*a, **kw)[::-1])
+
+    assert not check_parity(text, tokenizer, 64)["ok"]
@@ -1,19 +1,30 @@
+import asyncio
 import os
+import socket
 import time
-import json
-import re
 import redis
 import boto3
-import docx2txt
-import pdfplumber
-import pika
+import aio_pika
 from dotenv import load_dotenv
 from transformers import AutoTokenizer
 from botocore.client import Config
 from fastapi import FastAPI
 import threading
+from contextlib import nullcontext
 from fastapi.middleware.cors import CORSMiddleware
 
+from change_detector import S3ChangeDetector
+from chunker import legacy_chunk, offset_chunk
+from extraction import extract_pages, join_pages, assign_pages
+from object_stream import open_object
+from publisher import ChunkPublisher
+from manifest import ChunkManifest, chunk_ids
+from leases import Lease, LeaseLost, shard_of
+from config import (
+    S3_PREFIX, S3_POLL_INTERVAL, MAX_TOKENS, OVERLAP, CHUNKER, INCREMENTAL_INGEST,
+    INGEST_WORKER_ID, INGEST_SHARDS, INGEST_AUTOSTART,
+)
+
 # --- Load env variables ---
 load_dotenv()
 
@@ -40,6 +51,10 @@ s3_client = boto3.client(
     config=Config(signature_version="s3v4", s3={"addressing_style": "virtual"})
 )
 
+# --- Replica identity ---
+WORKER_ID = INGEST_WORKER_ID or f"{socket.gethostname()}:{os.getpid()}"
+worker_stats = {"worker_id": WORKER_ID, "processed": 0, "failed": 0, "lease_lost": 0}
+
 # --- Job Tracking ---
 def create_job(job_id, filename, total_chunks):
     print("JOB ID CREATED:", job_id)
@@ -53,186 +68,155 @@ def create_job(job_id, filename, total_chunks):
     }
     r.hset(f"job:{job_id}", mapping=job)
     r.expire(f"job:{job_id}", 60 * 60 * 24 * 7)
+    # Chunk ids the embedding worker has persisted for this run (see embedding-service/progress.py)
+    r.delete(f"job:{job_id}:done")
 
 def mark_processing(job_id):
     r.hset(f"job:{job_id}", "status", "processing")
     r.hset(f"job:{job_id}", "updated_at", time.time())
 
 # --- RabbitMQ Connect ---
-def connect_rabbitmq(max_retries=10, delay=5):
+async def connect_rabbitmq(max_retries=10, delay=5):
     for attempt in range(max_retries):
         try:
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(host="rabbitmq", heartbeat=60)
-            )
+            connection = await aio_pika.connect_robust(host="rabbitmq", heartbeat=60)
             print("✅ Connected to RabbitMQ")
             return connection
-        except pika.exceptions.AMQPConnectionError:
+        except (aio_pika.exceptions.AMQPConnectionError, ConnectionError):
             print(f"⏳ RabbitMQ not ready, retrying in {delay}s... (attempt {attempt+1}/{max_retries})")
-            time.sleep(delay)
+            await asyncio.sleep(delay)
     raise Exception("❌ Could not connect to RabbitMQ after retries")
 
-connection = connect_rabbitmq()
-channel = connection.channel()
-channel.queue_declare(queue=QUEUE_NAME, durable=True)
+publisher = ChunkPublisher(connect_rabbitmq, QUEUE_NAME)
+manifest = ChunkManifest(r)
 
 # --- Load Tokenizer ---
-MODEL_NAME = os.getenv("EMBED_MODEL", "sentence-transformers/all-mpnet-base-v2")
+MODEL_NAME = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
 
-MAX_TOKENS = int(os.getenv("MAX_TOKENS", 450))
-MIN_TOKENS = int(os.getenv("MIN_TOKENS", 20))
-OVERLAP = int(os.getenv("OVERLAP", 60))
-
-def tokenize_length(text: str) -> int:
-    return len(tokenizer.encode(text, add_special_tokens=False))
-
-# --- Block Detection ---
-def detect_blocks(text: str):
-    """Split into semantic blocks without section tagging."""
-    lines = text.split("\n")
-    blocks, buffer = [], []
-
-    def flush():
-        nonlocal buffer
-        if buffer:
-            blocks.append({"text": "\n".join(buffer).strip()})
-            buffer = []
-
-    for line in lines:
-        line_strip = line.strip()
-
-        if "|" in line_strip or "\t" in line_strip:
-            flush()
-            blocks.append({"text": f"[TABLE START]\n{line_strip}\n[TABLE END]"})
-            continue
-
-        if re.match(r"^(\*|-|•)\s+", line_strip) or re.match(r"^\d+\.\s+", line_strip):
-            buffer.append("[LIST ITEM] " + line_strip)
-            continue
-
-        if line_strip == "":
-            flush()
-        else:
-            buffer.append(line_strip)
-
-    flush()
-    return blocks
-
-# --- Chunking with Overlap ---
+# --- Chunking ---
 def dynamic_chunk(text: str, max_tokens=MAX_TOKENS, overlap=OVERLAP):
-    blocks = detect_blocks(text)
-    raw_chunks, buffer, buffer_tokens = [], [], 0
-
-    for block in blocks:
-        block_text = block["text"]
-        tokens = tokenizer.encode(block_text, add_special_tokens=False)
-
-        if len(tokens) > max_tokens:
-            words, sub_chunk, sub_tokens = block_text.split(), [], 0
-            for word in words:
-                word_tokens = tokenize_length(word)
-                if sub_tokens + word_tokens > max_tokens:
-                    raw_chunks.append({"text": " ".join(sub_chunk)})
-                    sub_chunk, sub_tokens = [word], word_tokens
-                else:
-                    sub_chunk.append(word)
-                    sub_tokens += word_tokens
-            if sub_chunk:
-                raw_chunks.append({"text": " ".join(sub_chunk)})
-            continue
-
-        if buffer_tokens + len(tokens) <= max_tokens:
-            buffer.append(block_text)
-            buffer_tokens += len(tokens)
-        else:
-            raw_chunks.append({"text": "\n\n".join(buffer)})
-            buffer, buffer_tokens = [block_text], len(tokens)
-
-    if buffer:
-        raw_chunks.append({"text": "\n\n".join(buffer)})
-
-    final_chunks = []
-    for i, chunk in enumerate(raw_chunks):
-        tokens = tokenizer.encode(chunk["text"], add_special_tokens=False)
-        if len(tokens) > max_tokens:
-            tokens = tokens[:max_tokens]
-
-        if overlap > 0 and i > 0:
-            prev_tokens = tokenizer.encode(final_chunks[-1]["text"], add_special_tokens=False)
-            overlap_tokens = prev_tokens[-overlap:]
-            tokens = overlap_tokens + tokens
-            tokens = tokens[:max_tokens]
-
-        final_chunks.append({"text": tokenizer.decode(tokens)})
-
-    return final_chunks
+    if CHUNKER == "legacy" or not tokenizer.is_fast:
+        return legacy_chunk(text, tokenizer, max_tokens, overlap)
+    return offset_chunk(text, tokenizer, max_tokens, overlap)
 
 # --- File Processing ---
-def extract_text_from_file(local_path: str):
-    if local_path.endswith(".pdf"):
-        text = ""
-        with pdfplumber.open(local_path) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() or ""
-        return text
-    elif local_path.endswith(".docx"):
-        return docx2txt.process(local_path)
-    else:
-        raise ValueError("Unsupported file type")
-
-def process_file(key: str):
-    local_path = f"/tmp/{os.path.basename(key)}"
-    s3_client.download_file(S3_BUCKET, key, local_path)
-
-    text = extract_text_from_file(local_path)
-    chunks = dynamic_chunk(text)
-
+def process_file(key: str, lease: Lease = None):
+    """
+    Extract, chunk and publish one object. With a lease, ownership is checked
+    before the job is reset and again before the sync goes out, so a replica
+    that lost the object stops before clobbering the new holder's run.
+    """
+    with open_object(s3_client, S3_BUCKET, key) as source:
+        pages = extract_pages(source, key)
+    chunks = assign_pages(dynamic_chunk(join_pages(pages)), pages)
+
+    ids = chunk_ids(key, chunks)
+    previous = manifest.load(key) if INCREMENTAL_INGEST else {}
+    changed = [i for i, doc_id in enumerate(ids) if doc_id not in previous]
+    vanished = len(set(previous) - set(ids))
+
+    if lease:
+        lease.check()
     job_id = os.path.basename(key)
-    create_job(job_id=job_id, filename=job_id, total_chunks=len(chunks))
+    create_job(job_id=job_id, filename=job_id, total_chunks=len(changed))
     mark_processing(job_id)
-
-    for i, chunk in enumerate(chunks):
-        payload = {
+    # The document changed, so any cached extraction for it is stale
+    r.delete(f"extracted:{job_id}")
+    # Set by rag-service once the document's policy has been verified, so re-ingested
+    # chunks keep their policy scope
+    policy_number = r.get(f"doc_policy:{job_id}")
+
+    payloads = [
+        {
             "key": key,
+            "doc_id": ids[i],
             "filename": os.path.basename(key),
             "bucket": S3_BUCKET,
             "chunk_id": i,
             "total_chunks": len(chunks),
-            "text": chunk["text"],
-            "metadata": {
-                "policy_number": os.path.splitext(os.path.basename(key))[0],
-                "chunk_type": "table" if "[TABLE START]" in chunk["text"] else "text"
-            }
+            "text": chunks[i]["text"],
+            "page_start": chunks[i].get("page_start"),
+            "page_end": chunks[i].get("page_end"),
+            "section": chunks[i].get("section", "GENERAL"),
+            "document_id": job_id,
+            "policy_number": policy_number,  # None until verified
+            "chunk_type": "table" if "[TABLE START]" in chunks[i]["text"] else "text",
         }
-        print(f"📤 Publishing chunk {i+1}/{len(chunks)} for {key}")
-        channel.basic_publish(
-            exchange="",
-            routing_key=QUEUE_NAME,
-            body=json.dumps(payload),
-            properties=pika.BasicProperties(delivery_mode=2)
-        )
-
-    print(f"✅ Sent {len(chunks)} chunks for {key} to RabbitMQ")
+        for i in changed
+    ]
+    if payloads:
+        publisher.publish(payloads)
+
+    # Tells the embedding worker which ids make up the document now, so it can
+    # drop vanished chunks and renumber unchanged ones without re-embedding them.
+    # A stale holder's sync would delete a newer version's chunks, so recheck first.
+    if lease:
+        lease.check()
+    # The embedding worker writes the manifest once the sync confirms which ids are stored
+    publisher.publish([{
+        "type": "sync",
+        "key": key,
+        "total_chunks": len(chunks),
+        "keep": {doc_id: i for i, doc_id in enumerate(ids)},
+    }])
+
+    if not changed:
+        r.hset(f"job:{job_id}", "status", "complete")
+
+    print(f"✅ Sent {len(changed)}/{len(chunks)} changed chunks for {key} to RabbitMQ "
+          f"({len(chunks) - len(changed)} unchanged, {vanished} removed)")
+
+def process_claimed(detector, shard: int, obj: dict):
+    """Process one pending object if this replica can take its lease."""
+    key = obj["key"]
+    lease = Lease(r, f"{shard}:{key}", WORKER_ID)
+    if not lease.acquire():
+        return  # another replica holds it
+    # pending() is a snapshot: another replica may have finished this object (and
+    # released its lease) since, or a newer version may have replaced it
+    if not detector.is_pending(obj):
+        lease.release()
+        return
+
+    with lease.heartbeat():
+        print(f"🔍 New file detected: {key} (shard {shard})")
+        try:
+            process_file(key, lease)
+            lease.check()
+            detector.mark_done(obj)
+            worker_stats["processed"] += 1
+        except LeaseLost:
+            # Whoever holds it now owns the pending entry and the job state
+            worker_stats["lease_lost"] += 1
+            print(f"⚠️ Lost the lease on {key}, leaving it to the new holder")
+        except Exception as e:
+            worker_stats["failed"] += 1
+            print(f"❌ Failed to process {key}: {e}")
 
 def poll_s3():
-    seen = set()
-    print(f"📦 Watching bucket: {S3_BUCKET}/uploads/")
+    detector = S3ChangeDetector(s3_client, r, S3_BUCKET, prefix=S3_PREFIX)
+    scanner = Lease(r, f"scanner:{S3_BUCKET}:{S3_PREFIX}", WORKER_ID)
+    first_shard = shard_of(WORKER_ID, INGEST_SHARDS)
+    print(f"📦 Watching bucket: {S3_BUCKET}/{S3_PREFIX} as {WORKER_ID}")
     while True:
-        response = s3_client.list_objects_v2(Bucket=S3_BUCKET, Prefix="uploads/")
-        contents = response.get("Contents", [])
-        print(f"🔎 Found {len(contents)} files in uploads/")
-
-        for obj in contents:
-            key = obj["Key"]
-            if key not in seen:
-                print(f"🔍 New file detected: {key}")
+        # Only the replica holding the scanner lease lists the bucket; every
+        # replica claims pending objects, starting from a different shard. The
+        # scanner keeps its lease alive through the drain (which can outlast
+        # LEASE_TTL) so scanning does not hop between replicas every cycle.
+        scanning = scanner.acquire()
+        with scanner.heartbeat(release=False) if scanning else nullcontext():
+            if scanning:
                 try:
-                    process_file(key)
-                    seen.add(key)
+                    detector.scan()
                 except Exception as e:
-                    print(f"❌ Failed to process {key}: {e}")
-        time.sleep(30)
+                    print(f"❌ Failed to list {S3_BUCKET}/{S3_PREFIX}: {e}")
+
+            for n in range(INGEST_SHARDS):
+                shard = (first_shard + n) % INGEST_SHARDS
+                for obj in detector.pending(shard):
+                    process_claimed(detector, shard, obj)
+        time.sleep(S3_POLL_INTERVAL)
 
 # --- FastAPI App ---
 app = FastAPI()
@@ -258,6 +242,15 @@ def start_polling():
         return {"status": "started"}
     return {"status": "already running"}
 
+@app.on_event("startup")
+def autostart_polling():
+    if INGEST_AUTOSTART:
+        start_polling()
+
+@app.get("/metrics")
+def metrics():
+    return {"worker": worker_stats, "publisher": publisher.stats}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=9000)
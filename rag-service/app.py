@@ -1,4 +1,5 @@
 import os
+import threading
 import redis
 import json
 import requests
@@ -14,10 +15,13 @@ from graph_conversation import conversation_chain
 from services.email_service import send_email
 from services.llm_service import extract_policy_metadata, extract_merged_policy_data, draft_fraud_alert, return_dummy
 from utils.verify_policy import verify_policy, get_policy_from_db
-from utils.chroma_client import retrieve_query
+from utils.chroma_client import retrieve_many, prewarm_queries, query_cache, document_scope
+from utils.policy_scope import scope_document, ensure_scoped
+from utils import rerank
 from utils.state_store import save_state, load_state
 from utils.conversation_state import ConversationStateModel
 from utils.cleanupFunc import collect_docs
+from utils.sections import EXTRACTION_QUERIES, FIELD_SECTIONS, section_filter
 
 
 from config import (
@@ -46,6 +50,17 @@ redis_inst = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True
 print(f"Starting RAG Service")
 
 
+@app.on_event("startup")
+def prewarm():
+    """Cache the fixed /upload extraction prompts in the background; the embeddings server may still be starting."""
+    threading.Thread(target=prewarm_queries, args=(list(EXTRACTION_QUERIES.values()),), daemon=True).start()
+
+
+@app.get("/metrics")
+def metrics():
+    """Query embedding cache hit/miss counters (this process and all replicas) and rerank stage stats."""
+    return {"query_cache": query_cache.metrics() if query_cache else None, "rerank": rerank.metrics()}
+
 
 def chunk_text(text: str, max_chars: int = 1000):
     """
@@ -73,9 +88,11 @@ def upload_doc(data: UploadRequest):
     """Check job status + return policy metadata once ready"""
 
     # --- 1. Ensure ingestion polling is running ---
+    # Ingestion replicas start polling on their own; this poke is a fallback and
+    # the flag expires so a restarted replica gets poked again.
     if not redis_inst.get("polling_started"):
         requests.post("http://ingestion-service:9000/start-polling")
-        redis_inst.set("polling_started", "1")
+        redis_inst.set("polling_started", "1", ex=60)
         print("⚡ Ingestion polling started")
 
     # --- 2. Check ingestion job status ---
@@ -103,33 +120,24 @@ def upload_doc(data: UploadRequest):
     extracted_key = f"extracted:{job_id}"
     if redis_inst.exists(extracted_key):
         print(f"✅ Returning cached extraction for {job_id}")
-        return json.loads(redis_inst.get(extracted_key))
+        cached = json.loads(redis_inst.get(extracted_key))
+        ensure_scoped(data.key, cached)  # documents verified before policy scoping
+        return cached
 
     # --- 4. Run extraction once ---
     print(f"⚡ Running extraction for {job_id}")
 
-    fields = {
-        "policyholder_name": "Find the policyholder name (the contract owner).",
-        "insured_person": "List all insured persons or covered individuals.",
-        "policy_number": "Find the policy number.",
-        "insurance_provider": "Find the insurance company/provider.",
-        "policy_type": "Find the type of insurance policy (health, motor, life, travel, etc.).",
-        "coverage": "List the coverage benefits provided by this policy.",
-        "start_date": "Find the start date of the policy.",
-        "end_date": "Find the expiry/end date of the policy."
-    }
-
-    document_texts = []
+    fields = EXTRACTION_QUERIES
 
-    for field, query_text in fields.items():
-        results = retrieve_query(
-            query_text,
-            VECTOR_COLLECTION,
-            mode="extraction",   # 👈 deterministic metadata mode
-            top_k=3
-        )
-        docs = collect_docs(results)
-        document_texts.extend(docs)
+    # One embedding call and one Chroma query per section for all fields; each chunk once
+    results = retrieve_many(
+        fields,
+        VECTOR_COLLECTION,
+        top_k=3,
+        wheres={field: section_filter(FIELD_SECTIONS.get(field)) for field in fields},
+        scope=document_scope(data.key),  # only this upload's chunks
+    )
+    document_texts = collect_docs(results)
 
 
     # --- 5. Run extraction on retrieved chunks directly ---
@@ -147,6 +155,7 @@ def upload_doc(data: UploadRequest):
             "status": "complete",
             "message": "❌ Not a valid insurance policy document."
         }
+        scope_document(data.key, None)
         redis_inst.set(extracted_key, json.dumps(response))
         return response
 
@@ -162,6 +171,7 @@ def upload_doc(data: UploadRequest):
             "status": "not_found",
             "message": "❌ Policy not found in database."
         }
+        scope_document(data.key, None)
         redis_inst.set(extracted_key, json.dumps(response))
         return response
 
@@ -173,6 +183,7 @@ def upload_doc(data: UploadRequest):
             "status": "error",
             "message": "⚠️ We could not verify this policy. Please contact support."
         }
+        scope_document(data.key, None)
         redis_inst.set(extracted_key, json.dumps(response))
         return response
 
@@ -182,6 +193,7 @@ def upload_doc(data: UploadRequest):
         "message": "✅ Insurance policy verified successfully.",
         **{f: final_extracted.get(f) for f in fields}
     }
+    scope_document(data.key, final_extracted["policy_number"])
     redis_inst.set(extracted_key, json.dumps(response))
     
     # 🔹 Save short-lived details by policy_number (30 minutes)
@@ -0,0 +1,271 @@
+"""
+Rerank stage benchmark: full rerank vs adaptive rerank (utils/rerank.py).
+
+Embeds a synthetic motor policy with the embedding model, retrieves
+--candidates chunks per question by squared L2 distance (Chroma's default),
+then reranks them two ways with the same local cross-encoder:
+
+    full      score every candidate, keep top_k (the previous behaviour)
+    adaptive  candidate_pool + skip + threshold
+
+Both strategies get their own score cache, so differences come from pool
+pruning alone. Each question is asked --rounds times to model follow-ups; the
+first (cold-cache) round is reported separately from the totals, which include
+cache hits. The report covers cross-encoder pairs and CPU seconds spent
+scoring, plus recall: the share of questions with a chunk from the right clause
+in the results. It also reports overlap@k with the full rerank results.
+
+    cd rag-service
+    python -m benchmarks.bench_rerank --out rerank.json
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from config import EMBED_MODEL, RERANK_MODEL, RERANK_CANDIDATES, RERANK_CLIFF, RERANK_MIN_SCORE
+from utils.rerank import adaptive_rerank, candidate_pool
+
+# topic -> clause sentences (each sentence is one chunk)
+POLICY = {
+    "windscreen": [
+        "Windscreen and window glass damage is covered without affecting your no claims discount.",
+        "A windscreen excess of £75 applies unless the glass is repaired rather than replaced.",
+        "You must use our approved glass repairer for windscreen claims.",
+    ],
+    "theft": [
+        "We will pay for loss of or damage to your car caused by theft or attempted theft.",
+        "Theft cover does not apply if the keys were left in or on the unattended vehicle.",
+        "Stolen vehicles must be reported to the police within 24 hours.",
+    ],
+    "fire": [
+        "Damage to your vehicle caused by fire, lightning or explosion is covered.",
+        "Fire damage resulting from an electrical fault in an aftermarket accessory is excluded.",
+    ],
+    "courtesy_car": [
+        "A courtesy car is provided while your vehicle is being repaired by an approved repairer.",
+        "The courtesy car is a small hatchback and is not available if your car is a total loss.",
+    ],
+    "personal_belongings": [
+        "Personal belongings in the car are covered up to £250 per incident.",
+        "Cash, credit cards and business equipment are not covered as personal belongings.",
+    ],
+    "wear_and_tear": [
+        "We will not pay for wear and tear, corrosion, mechanical or electrical breakdown.",
+        "Loss of value after a repair is excluded.",
+    ],
+    "claims": [
+        "To make a claim call our claims line as soon as possible, and within 30 days of the incident.",
+        "You must not admit liability or offer payment to any other party.",
+        "We may ask for photographs, repair estimates and a police crime reference.",
+    ],
+    "excess": [
+        "The compulsory excess is £250 and applies to every claim except windscreen claims.",
+        "A voluntary excess chosen by you is added to the compulsory excess.",
+        "Young drivers under 25 pay an additional excess of £300.",
+    ],
+    "driving_abroad": [
+        "Your policy gives the minimum cover required by law when driving in EU countries.",
+        "Full comprehensive cover abroad is limited to 90 days per trip.",
+    ],
+    "other_drivers": [
+        "Only the drivers named on your certificate of insurance are covered to drive your car.",
+        "Driving other cars cover is third party only and must be shown on your certificate.",
+    ],
+    "cancellation": [
+        "You can cancel within 14 days of receiving your documents and receive a full refund.",
+        "After 14 days a cancellation fee of £50 applies and we refund the unused premium.",
+    ],
+    "breakdown": [
+        "Roadside assistance is included if you chose the breakdown add-on.",
+        "Breakdown cover does not include the cost of parts or fuel.",
+    ],
+    "modifications": [
+        "You must tell us about any modification that changes the performance or appearance of your car.",
+        "Failure to declare modifications may invalidate your policy.",
+    ],
+    "legal_expenses": [
+        "Legal expenses cover pays up to £100,000 to recover uninsured losses after an accident that was not your fault.",
+    ],
+    "definitions": [
+        "Market value means the cost of replacing your car with one of the same make, model, age and condition.",
+        "Approved repairer means a garage we have chosen to carry out repairs under this policy.",
+        "Total loss means the cost of repair is more than the market value of the car.",
+    ],
+    "general": [
+        "This policy is a contract between you and us and is governed by the law of England and Wales.",
+        "We may record telephone calls for training and fraud prevention purposes.",
+        "Premiums must be paid by the date shown in your schedule.",
+    ],
+}
+
+QUESTIONS = [
+    ("Is my windscreen covered and will it affect my no claims bonus?", "windscreen"),
+    ("What happens if someone steals my car?", "theft"),
+    ("Am I covered if my keys were left in the car and it was stolen?", "theft"),
+    ("Does the policy pay out for fire damage?", "fire"),
+    ("Will I get a replacement car while mine is being fixed?", "courtesy_car"),
+    ("Is my laptop covered if it's stolen from the car?", "personal_belongings"),
+    ("Do you cover rust or mechanical failure?", "wear_and_tear"),
+    ("How do I make a claim?", "claims"),
+    ("What is my excess?", "excess"),
+    ("Can I drive in France with this policy?", "driving_abroad"),
+    ("Can my friend drive my car?", "other_drivers"),
+    ("How do I cancel and will I get money back?", "cancellation"),
+    ("Does it include breakdown recovery?", "breakdown"),
+    ("Do I need to tell you about alloy wheels I fitted?", "modifications"),
+    ("What does market value mean?", "definitions"),
+    ("Is legal cover included after an accident that was not my fault?", "legal_expenses"),
+]
+
+
+class MemoryScoreCache:
+    """Same interface as RerankScoreCache, without Redis."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get_many(self, query_text, ids):
+        return {i: self.data[(query_text, i)] for i in ids if (query_text, i) in self.data}
+
+    def put_many(self, query_text, scores):
+        for i, s in scores.items():
+            self.data[(query_text, i)] = s
+
+
+class TimedScorer:
+    """Wraps CrossEncoder.predict and counts pairs and CPU seconds."""
+
+    def __init__(self, model):
+        self.model = model
+        self.pairs = 0
+        self.cpu = 0.0
+
+    def __call__(self, query_text, docs):
+        start = time.process_time()
+        scores = [float(s) for s in self.model.predict([[query_text, d] for d in docs])]
+        self.cpu += time.process_time() - start
+        self.pairs += len(docs)
+        return scores
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def build_candidates(embedder, n: int):
+    chunks = [(f"{topic}__{i}", topic, text) for topic, texts in POLICY.items() for i, text in enumerate(texts)]
+    doc_vecs = embedder.encode([c[2] for c in chunks], convert_to_numpy=True)
+    q_vecs = embedder.encode([q for q, _ in QUESTIONS], convert_to_numpy=True)
+    per_question = []
+    for q_vec in q_vecs:
+        dists = ((doc_vecs - q_vec) ** 2).sum(axis=1)
+        order = np.argsort(dists)[:n]
+        per_question.append([
+            {"id": chunks[i][0], "text": chunks[i][2], "metadata": {"topic": chunks[i][1]}, "distance": float(dists[i])}
+            for i in order
+        ])
+    return per_question
+
+
+def full_rerank(question: str, cands: list, top_k: int, scorer: TimedScorer, cache: MemoryScoreCache):
+    """Score every candidate (through the same cache adaptive gets) and keep top_k."""
+    scores = cache.get_many(question, [c["id"] for c in cands])
+    todo = [c for c in cands if c["id"] not in scores]
+    if todo:
+        fresh = dict(zip((c["id"] for c in todo), scorer(question, [c["text"] for c in todo])))
+        cache.put_many(question, fresh)
+        scores.update(fresh)
+    ranked = sorted(cands, key=lambda c: scores[c["id"]], reverse=True)[:top_k]
+    return [{"text": c["text"], "metadata": c["metadata"], "score": scores[c["id"]]} for c in ranked]
+
+
+def run(strategy: str, candidates: list, scorer: TimedScorer, top_k: int, rounds: int, min_score: float):
+    """Returns (last round's results, wall seconds, (pairs, cpu) after the cold first round)."""
+    cache = MemoryScoreCache()
+    results, cold, start = [], None, time.perf_counter()
+    for _ in range(rounds):
+        results = []
+        for (question, _), cands in zip(QUESTIONS, candidates):
+            if strategy == "full":
+                results.append(full_rerank(question, cands, top_k, scorer, cache))
+            else:
+                results.append(adaptive_rerank(question, cands, top_k, scorer=scorer, cache=cache,
+                                               min_score=min_score))
+        cold = cold or (scorer.pairs, scorer.cpu)
+    return results, time.perf_counter() - start, cold
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--embed-model", default=EMBED_MODEL)
+    parser.add_argument("--rerank-model", default=RERANK_MODEL)
+    parser.add_argument("--candidates", type=int, default=RERANK_CANDIDATES)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=2, help="times each question is asked (follow-ups)")
+    parser.add_argument("--min-score", type=float, default=RERANK_MIN_SCORE)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    from sentence_transformers import CrossEncoder, SentenceTransformer
+
+    embedder = SentenceTransformer(args.embed_model)
+    candidates = build_candidates(embedder, args.candidates)
+    cross_encoder = CrossEncoder(args.rerank_model)
+    cross_encoder.predict([["warmup", "warmup"]])
+
+    report = {"commit": _git_commit(), "embed_model": args.embed_model, "rerank_model": args.rerank_model,
+              "questions": len(QUESTIONS), "rounds": args.rounds, "candidates": args.candidates,
+              "top_k": args.top_k, "cliff": RERANK_CLIFF, "min_score": args.min_score,
+              "avg_pool": round(np.mean([candidate_pool([c["distance"] for c in cands], args.top_k)
+                                         for cands in candidates]), 2),
+              "strategies": {}}
+
+    outputs = {}
+    for strategy in ("full", "adaptive"):
+        scorer = TimedScorer(cross_encoder)
+        results, seconds, (cold_pairs, cold_cpu) = run(strategy, candidates, scorer, args.top_k, args.rounds,
+                                                       args.min_score)
+        outputs[strategy] = results
+        hits = sum(any(r["metadata"]["topic"] == topic for r in res) for res, (_, topic) in zip(results, QUESTIONS))
+        report["strategies"][strategy] = {
+            "cold_pairs_per_query": round(cold_pairs / len(QUESTIONS), 2),
+            "cold_scoring_cpu_seconds": round(cold_cpu, 4),
+            "pairs_scored": scorer.pairs,
+            "pairs_per_query": round(scorer.pairs / (len(QUESTIONS) * args.rounds), 2),
+            "scoring_cpu_seconds": round(scorer.cpu, 4),
+            "wall_seconds": round(seconds, 4),
+            "recall": round(hits / len(QUESTIONS), 4),
+            "avg_results": round(np.mean([len(r) for r in results]), 2),
+        }
+
+    overlap = [len({r["text"] for r in a} & {r["text"] for r in f})
+               for a, f in zip(outputs["adaptive"], outputs["full"])]
+    report["strategies"]["adaptive"]["overlap_with_full"] = round(
+        sum(overlap) / max(1, sum(len(a) for a in outputs["adaptive"])), 4)
+
+    full, adaptive = report["strategies"]["full"], report["strategies"]["adaptive"]
+    for name, s in report["strategies"].items():
+        print(f"{name:<9} cold {s['cold_pairs_per_query']:>6} pairs/query {s['cold_scoring_cpu_seconds']:>8}s CPU  "
+              f"all rounds {s['pairs_per_query']:>6} pairs/query {s['scoring_cpu_seconds']:>8}s CPU  "
+              f"recall {s['recall']:.2%}  {s['avg_results']} results/query")
+    if full["cold_scoring_cpu_seconds"]:
+        print(f"\ncold round: adaptive uses {adaptive['cold_scoring_cpu_seconds'] / full['cold_scoring_cpu_seconds']:.1%} "
+              f"of full-rerank CPU (avg pool {report['avg_pool']} of {args.candidates})")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.out}")
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -9,8 +9,27 @@ VECTOR_DB_PORT = int(os.getenv("VECTOR_DB_PORT", 8000))
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 
-EMBED_MODEL = os.getenv("EMBED_MODEL", "mixedbread-ai/mxbai-embed-large-v1")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 EMBEDDINGS_URL = os.getenv("EMBEDDINGS_URL")
+# base64 little-endian vectors instead of JSON float arrays; float16 is our embedding-server only
+EMBED_ENCODING_FORMAT = os.getenv("EMBED_ENCODING_FORMAT", "base64")
+EMBED_DTYPE = os.getenv("EMBED_DTYPE", "float32")
+# Query embeddings: in-process LRU in front of Redis, keyed by model + normalised text
+QUERY_CACHE = os.getenv("QUERY_CACHE", "true").lower() == "true"
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", 60 * 60 * 24 * 7))
+# embedding-server /v1/rerank; when unset the cross-encoder is loaded in this process on first use
+RERANK_URL = os.getenv("RERANK_URL")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Adaptive rerank (utils/rerank.py): RERANK_CANDIDATES are fetched, cut at the first
+# distance "cliff" (a gap RERANK_CLIFF x the median gap) past top_k, and only that pool
+# is scored. Pools no larger than top_k are returned in distance order unscored.
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 20))
+RERANK_CLIFF = float(os.getenv("RERANK_CLIFF", 3.0))
+RERANK_SKIP_DECISIVE = os.getenv("RERANK_SKIP_DECISIVE", "true").lower() == "true"
+# Scored chunks below this logit are dropped (keeping at least one); ms-marco logits run ~-11..+10
+RERANK_MIN_SCORE = float(os.getenv("RERANK_MIN_SCORE", -5.0))
+RERANK_CACHE_TTL = int(os.getenv("RERANK_CACHE_TTL", 60 * 30))  # follow-up questions in one session
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "none")
 OPENAI_MODEL   = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 KNN_SEARCH = int(os.getenv("KNN_SEARCH", 10))
@@ -2,8 +2,9 @@ from datetime import datetime, timedelta
 from langgraph.graph import StateGraph, END
 from services.llm_service import call_llm
 from services.email_service import send_email
-from utils.chroma_client import retrieve_query
+from utils.chroma_client import retrieve_query, policy_scope
 from utils.cleanupFunc import collect_docs
+from utils.sections import section_filter, section_for_query
 from utils.memory_utils import HybridMemory
 from config import VECTOR_COLLECTION, LLM_LIGHT_MODEL
 
@@ -112,9 +113,12 @@ def rag_agent(state: dict):
     history_text = past.get("history", "").strip()
 
     rewritten_query = rewrite_query(question, history_text)
-    results = retrieve_query(rewritten_query, VECTOR_COLLECTION, top_k=5)
+    where = section_filter(section_for_query(rewritten_query) or section_for_query(question))
+    # Only this policy's chunks; documents are tagged with it once /upload verifies them
+    scope = policy_scope(state.get("policy_number"))
+    results = retrieve_query(rewritten_query, VECTOR_COLLECTION, top_k=5, where=where, scope=scope)
     if not results:
-        results = retrieve_query(question, VECTOR_COLLECTION, top_k=5)
+        results = retrieve_query(question, VECTOR_COLLECTION, top_k=5, where=where, scope=scope)
 
     docs = collect_docs(results)
     doc_text = "\n".join(docs).strip()
@@ -0,0 +1,49 @@
+"""
+Tag chunks of documents verified before policy-scoped retrieval.
+
+/query filters on the policy_number chunk metadata, which older chunks lack.
+/upload tags a document when its cached result is served again; this tags every
+document with a cached verified extraction (extracted:{job_id}) in one go.
+
+    cd rag-service
+    python -m scripts.backfill_policy_scope [--dry-run]
+"""
+import argparse
+import json
+import sys
+
+from config import VECTOR_COLLECTION
+from utils.chroma_client import get_vectorDB_collection_instance
+from utils.policy_scope import redis_client, ensure_scoped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    collection = get_vectorDB_collection_instance(VECTOR_COLLECTION)
+    scoped = skipped = 0
+    for extracted_key in redis_client.scan_iter("extracted:*"):
+        job_id = extracted_key.split(":", 1)[1]
+        extraction = json.loads(redis_client.get(extracted_key) or "{}")
+        if extraction.get("status") != "complete" or not extraction.get("policy_number"):
+            skipped += 1
+            continue
+        # Chunks have always carried filename (the job id); take the S3 key from one
+        found = collection.get(where={"filename": job_id}, limit=1, include=["metadatas"])
+        if not found["ids"]:
+            print(f"⚠️ No chunks stored for {job_id}")
+            skipped += 1
+            continue
+        key = found["metadatas"][0]["key"]
+        print(f"{'Would scope' if args.dry_run else 'Scoping'} {key} -> {extraction['policy_number']}")
+        if not args.dry_run:
+            ensure_scoped(key, extraction)
+        scoped += 1
+
+    print(f"\n{scoped} documents scoped, {skipped} skipped")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,19 +1,23 @@
+import base64
+import json
 import os
+import numpy as np
 import requests
 from chromadb import HttpClient
-from sentence_transformers import CrossEncoder
 
 from config import (
     VECTOR_DB_HOST, VECTOR_DB_PORT,
-    EMBED_MODEL, EMBEDDINGS_URL,
-    KNN_SEARCH, VECTOR_POLICY_COLLECTION,
+    EMBED_MODEL, EMBEDDINGS_URL, EMBED_ENCODING_FORMAT, EMBED_DTYPE,
+    KNN_SEARCH, VECTOR_POLICY_COLLECTION, REDIS_HOST, REDIS_PORT, QUERY_CACHE, RERANK_CANDIDATES,
 )
+from utils.query_cache import QueryEmbeddingCache, normalize_query
+from utils.rerank import adaptive_rerank
 
 VECTOR_DB_HOST = os.getenv("VECTOR_DB_HOST", "vector-db")
 VECTOR_DB_PORT = int(os.getenv("VECTOR_DB_PORT", 8000))
 
-# Load reranker model (fast and accurate for reranking)
-reranker = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Query embeddings cache (in-process LRU + Redis)
+query_cache = QueryEmbeddingCache(REDIS_HOST, REDIS_PORT) if QUERY_CACHE else None
 
 
 # Initialize Chroma client
@@ -23,19 +27,90 @@ def get_vectorDB_collection_instance(collection_name):
     # Collection for insurance docs
     return chroma_client.get_or_create_collection(collection_name)
 
+def decode_embedding(value) -> list:
+    """Vectors arrive as float lists or as base64 little-endian float32/float16 bytes."""
+    if isinstance(value, str):
+        dtype = "<f2" if EMBED_DTYPE == "float16" else "<f4"
+        return np.frombuffer(base64.b64decode(value), dtype=dtype).astype(np.float32).tolist()
+    return value
+
+
+def embed_queries(texts: list) -> list:
+    """Embed query texts, serving repeats from the cache; misses go to EMBEDDINGS_URL in one call."""
+    texts = [normalize_query(t) for t in texts]
+    vectors = query_cache.get_many(EMBED_MODEL, texts) if query_cache else [None] * len(texts)
+    missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+    if not missing:
+        return vectors
+
+    payload = {"model": EMBED_MODEL, "input": missing, "encoding_format": EMBED_ENCODING_FORMAT}
+    if EMBED_DTYPE != "float32":
+        payload["dtype"] = EMBED_DTYPE
+    resp = requests.post(EMBEDDINGS_URL, json=payload, timeout=30)
+    resp.raise_for_status()
+    fetched = [decode_embedding(d["embedding"]) for d in sorted(resp.json()["data"], key=lambda d: d["index"])]
+    if query_cache:
+        query_cache.put_many(EMBED_MODEL, missing, fetched)
+
+    by_text = dict(zip(missing, fetched))
+    return [v if v is not None else by_text[t] for t, v in zip(texts, vectors)]
+
+
+def embed_query(text: str) -> list:
+    return embed_queries([text])[0]
+
+
+def prewarm_queries(texts: list):
+    """Embed fixed prompts ahead of the first request (failures only log)."""
+    try:
+        embed_queries(texts)
+        print(f"🔥 Prewarmed {len(texts)} query embeddings")
+    except Exception as e:
+        print(f"⚠️ Query embedding prewarm failed: {e}")
+
+
+def combine_filters(*filters) -> dict | None:
+    """AND together Chroma where filters, skipping empty ones."""
+    filters = [f for f in filters if f]
+    if len(filters) > 1:
+        return {"$and": filters}
+    return filters[0] if filters else None
+
+
+def policy_scope(policy_number: str | None) -> dict | None:
+    return {"policy_number": policy_number} if policy_number else None
+
+
+def document_scope(key: str | None) -> dict | None:
+    return {"key": key} if key else None
+
+
+def tag_document(collection_name: str, key: str, metadata: dict) -> int:
+    """Merge metadata (e.g. a verified policy_number) into every stored chunk of one document."""
+    collection = get_vectorDB_collection_instance(collection_name)
+    ids = collection.get(where=document_scope(key), include=[])["ids"]
+    if ids:
+        collection.update(ids=ids, metadatas=[dict(metadata) for _ in ids])
+    return len(ids)
+
+
 def retrieve_query(
     query_text,
     collection_name,
     mode: str = "qa",   # "qa" or "extraction"
     top_k: int = 5,
     where: dict | None = None,
+    scope: dict | None = None,
 ):
     """
     Query ChromaDB for relevant chunks of a given policy.
 
     Modes:
         - "qa": for conversational Q&A, recall-focused.
-          Fetch 20 candidates, rerank with cross-encoder, return top_k.
+          Fetch RERANK_CANDIDATES candidates and rerank the ones before the
+          first distance cliff with the cross-encoder (see utils/rerank.py),
+          return up to top_k that clear RERANK_MIN_SCORE.
+          The cross-encoder runs on the embedding-server when RERANK_URL is set.
         - "extraction": for structured policy metadata extraction.
           Fetch only 2 raw chunks (no reranking), return them directly.
 
@@ -44,24 +119,37 @@ def retrieve_query(
         collection_name: Chroma collection name
         mode: "qa" or "extraction"
         top_k: how many docs to return
-        where: optional metadata filter (e.g., {"section": "SCHEDULE"})
+        where: optional metadata filter (e.g., {"section": "SCHEDULE"});
+               ignored if nothing matches it
+        scope: filter that is always applied, e.g. policy_scope(...) or
+               document_scope(...), so only one policy's chunks are ranked
     """
     # Step 1: Get embedding
-    payload = {"model": EMBED_MODEL, "input": query_text}
-    resp = requests.post(EMBEDDINGS_URL, json=payload, timeout=30)
-    resp.raise_for_status()
-    query_vector = resp.json()["data"][0]["embedding"]
+    query_vector = embed_query(query_text)
 
     collection = get_vectorDB_collection_instance(collection_name)
 
-    # --- Mode: extraction (fast, precise, no reranking)
-    if mode == "extraction":
+    def search(n_results):
+        """Query with the filter within scope; drop the filter (never the scope) if it matches nothing."""
         results = collection.query(
             query_embeddings=[query_vector],
-            n_results=3,
-            #where=where,
+            n_results=n_results,
+            where=combine_filters(scope, where),
             include=["documents", "metadatas", "distances"],
         )
+        if where and not results.get("documents", [[]])[0]:
+            print(f"[retrieve_query] ⚠️ No results for {where}, retrying with scope {scope} only")
+            results = collection.query(
+                query_embeddings=[query_vector],
+                n_results=n_results,
+                where=scope,
+                include=["documents", "metadatas", "distances"],
+            )
+        return results
+
+    # --- Mode: extraction (fast, precise, no reranking)
+    if mode == "extraction":
+        results = search(3)
         docs = results.get("documents", [[]])[0]
         metas = results.get("metadatas", [[]])[0]
         if not docs:
@@ -71,29 +159,93 @@ def retrieve_query(
 
     # --- Mode: qa (deep search + rerank)
     elif mode == "qa":
-        results = collection.query(
-            query_embeddings=[query_vector],
-            n_results=20,
-            where=where,
-            include=["documents", "metadatas", "distances"],
-        )
+        results = search(RERANK_CANDIDATES)
         docs = results.get("documents", [[]])[0]
-        metas = results.get("metadatas", [[]])[0]
 
         if not docs:
             print("[retrieve_query] ❌ No results for QA")
             return []
 
-        # Rerank
-        pairs = [[query_text, doc] for doc in docs]
-        scores = reranker.predict(pairs)
-        reranked = sorted(zip(docs, metas, scores), key=lambda x: x[2], reverse=True)
-        return [{"text": d, "metadata": m, "score": s} for d, m, s in reranked[:top_k]]
+        candidates = [
+            {"id": i, "text": d, "metadata": m, "distance": dist}
+            for i, d, m, dist in zip(results["ids"][0], docs, results["metadatas"][0], results["distances"][0])
+        ]
+        return adaptive_rerank(query_text, candidates, top_k)
 
     else:
         raise ValueError(f"Invalid mode: {mode}")
 
 
+def retrieve_many(
+    queries: dict,
+    collection_name,
+    top_k: int = 3,
+    wheres: dict | None = None,
+    scope: dict | None = None,
+):
+    """
+    Batched extraction-mode retrieval for several named queries (no reranking).
+
+    All query texts are embedded in one call. Queries that share a filter go
+    to Chroma together as one multi-query collection.query, so eight prompts
+    over three sections cost three queries. A query whose filter matches
+    nothing is retried with the scope only, as retrieve_query does.
+
+    Args:
+        queries: name -> query text
+        wheres: name -> optional metadata filter for that query
+        scope: filter applied to every query (e.g. document_scope(key))
+
+    Returns the union of matched chunks, each once, best distance first:
+        [{"id", "text", "metadata", "distance", "fields": [names that matched it]}]
+    """
+    names = list(queries)
+    if not names:
+        return []
+    wheres = wheres or {}
+    vectors = dict(zip(names, embed_queries([queries[n] for n in names])))
+    collection = get_vectorDB_collection_instance(collection_name)
+    chunks = {}  # id -> chunk
+
+    def search(group: list, where) -> list:
+        """Run one multi-query; returns the names that matched nothing."""
+        results = collection.query(
+            query_embeddings=[vectors[n] for n in group],
+            n_results=top_k,
+            where=combine_filters(scope, where),
+            include=["documents", "metadatas", "distances"],
+        )
+        empty = []
+        for name, ids, docs, metas, dists in zip(
+            group, results["ids"], results["documents"], results["metadatas"], results["distances"]
+        ):
+            if not ids:
+                empty.append(name)
+            for i, d, m, dist in zip(ids, docs, metas, dists):
+                chunk = chunks.setdefault(i, {"id": i, "text": d, "metadata": m, "distance": dist, "fields": []})
+                chunk["distance"] = min(chunk["distance"], dist)
+                chunk["fields"].append(name)
+        return empty
+
+    groups = {}  # filter (as JSON) -> names using it
+    for name in names:
+        groups.setdefault(json.dumps(wheres.get(name), sort_keys=True), []).append(name)
+
+    retry = []
+    for key, group in groups.items():
+        where = json.loads(key)
+        empty = search(group, where)
+        if where:
+            retry.extend(empty)
+    if retry:
+        print(f"[retrieve_many] ⚠️ No results for {retry} with their filters, retrying with scope {scope} only")
+        search(retry, None)
+
+    print(f"[retrieve_many] {len(names)} queries, {len(groups) + bool(retry)} Chroma calls, "
+          f"{len(chunks)} distinct chunks")
+    return sorted(chunks.values(), key=lambda c: c["distance"])
+
+
 def retrieve_get(unique_key):
 
     policy_client = get_vectorDB_collection_instance(VECTOR_POLICY_COLLECTION)
@@ -0,0 +1,39 @@
+import os
+
+import redis
+
+from config import REDIS_HOST, REDIS_PORT, VECTOR_COLLECTION
+from utils.chroma_client import tag_document
+
+redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+
+def scope_document(key: str, policy_number: str | None):
+    """
+    Tag a document's chunks with its verified policy so /query can filter on it.
+    None takes a previously verified document back out of that policy's scope.
+    """
+    job_id = os.path.basename(key)
+    previous = redis_client.get(f"doc_policy:{job_id}")
+    if policy_number is None and previous is None:
+        return  # never tagged
+
+    tagged = tag_document(VECTOR_COLLECTION, key, {"policy_number": policy_number or "", "document_id": job_id})
+    if policy_number:
+        # Ingestion reads doc_policy so re-ingested chunks keep the tag
+        redis_client.set(f"doc_policy:{job_id}", policy_number)
+    else:
+        redis_client.delete(f"doc_policy:{job_id}")
+    print(f"🏷️ Scoped {tagged} chunks of {key} to policy {policy_number or '(none)'}")
+
+
+def ensure_scoped(key: str, extraction: dict):
+    """
+    Tag a document whose cached /upload result is a verified policy but which was
+    never tagged (verified before chunks carried policy_number).
+    """
+    policy_number = extraction.get("policy_number")
+    if extraction.get("status") != "complete" or not policy_number:
+        return
+    if redis_client.get(f"doc_policy:{os.path.basename(key)}") != policy_number:
+        scope_document(key, policy_number)
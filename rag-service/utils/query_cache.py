@@ -0,0 +1,120 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import redis
+
+from config import QUERY_CACHE_SIZE, QUERY_CACHE_TTL
+
+STATS_KEY = "stats:query_cache"
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(model: str, text: str) -> str:
+    """Model name + sha256 of the whitespace-normalised query."""
+    digest = hashlib.sha256(f"{model}\0{normalize_query(text)}".encode("utf-8")).hexdigest()
+    return f"qemb:{model}:{digest}"
+
+
+class QueryEmbeddingCache:
+    """
+    Two-tier cache for query embeddings consulted before EMBEDDINGS_URL.
+
+    An in-process LRU of max_entries vectors sits in front of Redis (shared by
+    every replica, entries expire after ttl). Redis hits are copied into the
+    LRU. Redis errors count as misses so a Redis outage only costs the network
+    hop. Hit/miss counters are kept per process in self.stats and aggregated
+    across replicas in the Redis hash stats:query_cache.
+    """
+
+    def __init__(self, host: str, port: int, max_entries: int = QUERY_CACHE_SIZE, ttl: int = QUERY_CACHE_TTL):
+        self.r = redis.Redis(host=host, port=port)  # binary values, no decoding
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.lru = OrderedDict()  # key -> vector, least recently used first
+        self.stats = {"lru_hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0}
+        self._lock = threading.Lock()  # FastAPI runs sync endpoints on a thread pool
+
+    # --- LRU tier ---
+    def _lru_get(self, key):
+        with self._lock:
+            vector = self.lru.get(key)
+            if vector is not None:
+                self.lru.move_to_end(key)
+            return vector
+
+    def _lru_put(self, key, vector):
+        with self._lock:
+            self.lru[key] = vector
+            self.lru.move_to_end(key)
+            while len(self.lru) > self.max_entries:
+                self.lru.popitem(last=False)
+
+    # --- Public API ---
+    def get_many(self, model: str, texts: list) -> list:
+        """Return a vector (list of floats) or None for each text."""
+        keys = [cache_key(model, t) for t in texts]
+        found = {k: v for k in keys if (v := self._lru_get(k)) is not None}
+        lru_hits = len(found)
+
+        missing = list(dict.fromkeys(k for k in keys if k not in found))
+        redis_hits = 0
+        if missing:
+            try:
+                for k, raw in zip(missing, self.r.mget(missing)):
+                    if raw is not None:
+                        found[k] = np.frombuffer(raw, dtype="<f4").tolist()
+                        self._lru_put(k, found[k])
+                        redis_hits += 1
+            except redis.RedisError as e:
+                self.stats["redis_errors"] += 1
+                print(f"[query_cache] ⚠️ Redis unavailable: {e}")
+
+        self._count(lru_hits, redis_hits, len(keys) - lru_hits - redis_hits)
+        return [found.get(k) for k in keys]
+
+    def put_many(self, model: str, texts: list, vectors: list):
+        items = [(cache_key(model, t), list(v)) for t, v in zip(texts, vectors)]
+        for k, v in items:
+            self._lru_put(k, v)
+        try:
+            pipe = self.r.pipeline(transaction=False)
+            for k, v in items:
+                pipe.set(k, np.asarray(v, dtype="<f4").tobytes(), ex=self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            self.stats["redis_errors"] += 1
+            print(f"[query_cache] ⚠️ Redis unavailable: {e}")
+
+    # --- Stats ---
+    def _count(self, lru_hits: int, redis_hits: int, misses: int):
+        counts = {"lru_hits": lru_hits, "redis_hits": redis_hits, "misses": misses}
+        for field, n in counts.items():
+            self.stats[field] += n
+        try:
+            pipe = self.r.pipeline(transaction=False)
+            for field, n in counts.items():
+                if n:
+                    pipe.hincrby(STATS_KEY, field, n)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def metrics(self) -> dict:
+        lookups = self.stats["lru_hits"] + self.stats["redis_hits"] + self.stats["misses"]
+        hits = self.stats["lru_hits"] + self.stats["redis_hits"]
+        try:
+            shared = {k.decode(): int(v) for k, v in self.r.hgetall(STATS_KEY).items()}
+        except redis.RedisError:
+            shared = None
+        return {
+            "process": {**self.stats, "hit_rate": round(hits / lookups, 4) if lookups else 0.0},
+            "all_replicas": shared,
+            "lru_entries": len(self.lru),
+            "lru_max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+        }
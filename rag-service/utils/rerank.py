@@ -0,0 +1,163 @@
+"""
+Adaptive cross-encoder reranking for QA retrieval.
+
+    1. Pool: candidates arrive sorted by vector distance and are cut at the
+       first "cliff" past top_k, i.e. a gap of at least RERANK_CLIFF times the
+       median gap. Candidates beyond a clear break are not worth scoring.
+    2. Skip: if the pool is no larger than top_k, reranking cannot change which
+       chunks are returned, so they come back in distance order (score None).
+    3. Cache: scores are cached in Redis per (query, chunk id). Chunk ids are
+       content-derived, so a cached score stays valid until the chunk changes.
+       Only unseen pairs are sent to the cross-encoder.
+    4. Threshold: scored chunks below RERANK_MIN_SCORE are dropped, but at
+       least one result is always kept.
+"""
+import hashlib
+import statistics
+import threading
+
+import redis
+import requests
+
+from config import (
+    REDIS_HOST, REDIS_PORT, RERANK_URL, RERANK_MODEL,
+    RERANK_CLIFF, RERANK_SKIP_DECISIVE, RERANK_MIN_SCORE, RERANK_CACHE_TTL,
+)
+from utils.query_cache import normalize_query
+
+# Local cross-encoder, only loaded when RERANK_URL is not set
+_reranker = None
+
+stats = {"queries": 0, "candidates": 0, "pooled": 0, "scored": 0, "cached": 0, "skipped": 0, "below_threshold": 0}
+_stats_lock = threading.Lock()
+
+
+def get_reranker():
+    global _reranker
+    if _reranker is None:
+        from sentence_transformers import CrossEncoder
+
+        print(f"[rerank] Loading local cross-encoder {RERANK_MODEL}")
+        _reranker = CrossEncoder(RERANK_MODEL)
+    return _reranker
+
+
+def rerank_scores(query_text: str, docs: list) -> list | None:
+    """
+    Cross-encoder score per doc. Uses the embedding-server's /v1/rerank when
+    RERANK_URL is set (None if it fails, so callers keep retrieval order),
+    otherwise the local model.
+    """
+    if not RERANK_URL:
+        return [float(s) for s in get_reranker().predict([[query_text, d] for d in docs])]
+    try:
+        resp = requests.post(RERANK_URL, json={"model": RERANK_MODEL, "query": query_text, "documents": docs},
+                             timeout=30)
+        resp.raise_for_status()
+    except requests.RequestException as e:
+        print(f"[rerank] ⚠️ {RERANK_URL} failed ({e}), keeping retrieval order")
+        return None
+    scores = [None] * len(docs)
+    for r in resp.json()["results"]:
+        scores[r["index"]] = r["relevance_score"]
+    return scores
+
+
+class RerankScoreCache:
+    """Cross-encoder scores in Redis, one hash per (model, normalised query) keyed by chunk id."""
+
+    def __init__(self, client, model: str = RERANK_MODEL, ttl: int = RERANK_CACHE_TTL):
+        self.r = client
+        self.model = model
+        self.ttl = ttl
+
+    def _key(self, query_text: str) -> str:
+        digest = hashlib.sha256(f"{self.model}\0{normalize_query(query_text)}".encode("utf-8")).hexdigest()
+        return f"rrk:{self.model}:{digest}"
+
+    def get_many(self, query_text: str, ids: list) -> dict:
+        try:
+            values = self.r.hmget(self._key(query_text), ids)
+        except redis.RedisError:
+            return {}
+        return {i: float(v) for i, v in zip(ids, values) if v is not None}
+
+    def put_many(self, query_text: str, scores: dict):
+        if not scores:
+            return
+        key = self._key(query_text)
+        try:
+            pipe = self.r.pipeline(transaction=False)
+            pipe.hset(key, mapping={i: repr(float(s)) for i, s in scores.items()})
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"[rerank] ⚠️ Score cache unavailable: {e}")
+
+
+score_cache = RerankScoreCache(redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True))
+
+
+def candidate_pool(distances: list, min_size: int, cliff: float = RERANK_CLIFF) -> int:
+    """How many of the distance-sorted candidates to score: up to the first cliff at or past min_size."""
+    if len(distances) <= min_size:
+        return len(distances)
+    gaps = [b - a for a, b in zip(distances, distances[1:])]
+    typical = statistics.median(gaps) or 1e-9
+    for i in range(min_size - 1, len(gaps)):
+        if gaps[i] >= cliff * typical:
+            return i + 1
+    return len(distances)
+
+
+def _count(**counts):
+    with _stats_lock:
+        for k, n in counts.items():
+            stats[k] += n
+
+
+def adaptive_rerank(query_text: str, candidates: list, top_k: int, scorer=rerank_scores,
+                    cache=score_cache, min_score: float = RERANK_MIN_SCORE,
+                    skip_decisive: bool = RERANK_SKIP_DECISIVE) -> list:
+    """
+    candidates: [{"id", "text", "metadata", "distance"}] sorted by distance.
+    Returns up to top_k [{"text", "metadata", "score"}], best first.
+    """
+    if not candidates:
+        return []
+    size = candidate_pool([c["distance"] for c in candidates], min(top_k, len(candidates)))
+    pool = candidates[:size]
+    _count(queries=1, candidates=len(candidates), pooled=len(pool))
+
+    if skip_decisive and len(pool) <= top_k:
+        _count(skipped=1)
+        return [{"text": c["text"], "metadata": c["metadata"], "score": None} for c in pool]
+
+    scores = cache.get_many(query_text, [c["id"] for c in pool]) if cache else {}
+    todo = [c for c in pool if c["id"] not in scores]
+    _count(cached=len(pool) - len(todo), scored=len(todo))
+    if todo:
+        fresh = scorer(query_text, [c["text"] for c in todo])
+        if fresh is None:  # reranker unavailable: keep distance order
+            return [{"text": c["text"], "metadata": c["metadata"], "score": None} for c in pool[:top_k]]
+        new = {c["id"]: s for c, s in zip(todo, fresh) if s is not None}
+        scores.update(new)
+        if cache:
+            cache.put_many(query_text, new)
+
+    ranked = sorted(pool, key=lambda c: scores.get(c["id"], float("-inf")), reverse=True)[:top_k]
+    kept = [c for c in ranked if scores.get(c["id"], float("-inf")) >= min_score] or ranked[:1]
+    _count(below_threshold=len(ranked) - len(kept))
+    return [{"text": c["text"], "metadata": c["metadata"], "score": scores.get(c["id"])} for c in kept]
+
+
+def metrics() -> dict:
+    with _stats_lock:
+        s = dict(stats)
+    q = s["queries"] or 1
+    return {
+        **s,
+        "avg_pool": round(s["pooled"] / q, 2),
+        "avg_scored": round(s["scored"] / q, 2),
+        "skip_rate": round(s["skipped"] / q, 4),
+    }
@@ -0,0 +1,47 @@
+import re
+
+# Sections tagged at ingestion (see ingestion-service/chunker.py)
+SECTIONS = ("SCHEDULE", "DEFINITIONS", "EXCLUSIONS", "CLAIMS", "BENEFITS", "GENERAL")
+
+# Fixed retrieval prompt for each /upload extraction field (their embeddings are prewarmed at startup).
+EXTRACTION_QUERIES = {
+    "policyholder_name": "Find the policyholder name (the contract owner).",
+    "insured_person": "List all insured persons or covered individuals.",
+    "policy_number": "Find the policy number.",
+    "insurance_provider": "Find the insurance company/provider.",
+    "policy_type": "Find the type of insurance policy (health, motor, life, travel, etc.).",
+    "coverage": "List the coverage benefits provided by this policy.",
+    "start_date": "Find the start date of the policy.",
+    "end_date": "Find the expiry/end date of the policy.",
+}
+
+# Section that holds each /upload extraction field; None searches every section.
+FIELD_SECTIONS = {
+    "policyholder_name": "SCHEDULE",
+    "insured_person": "SCHEDULE",
+    "policy_number": "SCHEDULE",
+    "insurance_provider": None,
+    "policy_type": "SCHEDULE",
+    "coverage": "BENEFITS",
+    "start_date": "SCHEDULE",
+    "end_date": "SCHEDULE",
+}
+
+# Only unambiguous question types are routed to one section.
+QUERY_SECTION_PATTERNS = [
+    ("EXCLUSIONS", re.compile(r"\b(exclu\w*|not covered|isn'?t covered|aren'?t covered)\b", re.I)),
+    ("DEFINITIONS", re.compile(r"\b(what does .+ mean|definition of|defined as|meaning of)\b", re.I)),
+    ("CLAIMS", re.compile(r"\b(how (do|can) i (make|lodge|file|submit) a claim|claim (form|process|procedure))\b", re.I)),
+]
+
+
+def section_filter(section: str | None) -> dict | None:
+    return {"section": section} if section else None
+
+
+def section_for_query(question: str) -> str | None:
+    """Pick the section a Q&A question is clearly about, or None to search all."""
+    for section, pattern in QUERY_SECTION_PATTERNS:
+        if pattern.search(question or ""):
+            return section
+    return None